@@ -0,0 +1,70 @@
+"""
+Encode/decode cost and bytes on the wire for the TCPutils codecs.
+
+Payloads mimic the DB server responses for list_all_rooms and
+get_comments_by_game_id.
+
+    uv run benchmarks/bench_codec.py [rows]
+"""
+import json
+import sys
+import timeit
+
+from utils.TCPutils import CODECS, orjson
+
+
+def rooms_response(rows: int) -> dict:
+    # id, name, hostUserId, visibility, status, gameId, gameName
+    data = [
+        [i, f"room_{i}", 1000 + i, "public" if i % 3 else "private",
+         "idle" if i % 2 else "playing", i % 7 + 1, f"game_{i % 7}"]
+        for i in range(1, rows + 1)
+    ]
+    return {"status": "ok", "data": data}
+
+
+def comments_response(rows: int) -> dict:
+    # comment_id, user_name, content, score, timestamp
+    data = [
+        [i, f"player_{i % 50}", "Fun game, would play again! " * (1 + i % 4),
+         i % 5 + 1, f"2025-11-{i % 28 + 1:02d} 12:{i % 60:02d}:00"]
+        for i in range(1, rows + 1)
+    ]
+    return {"status": "ok", "data": data}
+
+
+class StdlibJson:
+    """json module without the orjson fast path, for comparison."""
+    name = "json (stdlib)"
+
+    def encode(self, obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def decode(self, data):
+        return json.loads(str(data, "utf-8"))
+
+
+def measure(codec, payload: dict, number: int) -> tuple[int, float, float]:
+    encoded = codec.encode(payload)
+    view = memoryview(encoded)
+    enc = min(timeit.repeat(lambda: codec.encode(payload), number=number, repeat=3)) / number
+    dec = min(timeit.repeat(lambda: codec.decode(view), number=number, repeat=3)) / number
+    assert codec.decode(view) == payload
+    return len(encoded), enc * 1e6, dec * 1e6
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    codecs = [StdlibJson(), *CODECS.values()] if orjson else list(CODECS.values())
+    print(f"orjson available: {orjson is not None}")
+    for label, payload in (("list_all_rooms", rooms_response(rows)),
+                           ("get_comments_by_game_id", comments_response(rows))):
+        print(f"\n{label} ({rows} rows)")
+        print(f"  {'codec':<16} {'bytes':>10} {'encode us':>12} {'decode us':>12}")
+        for codec in codecs:
+            size, enc, dec = measure(codec, payload, number=200)
+            print(f"  {codec.name:<16} {size:>10} {enc:>12.1f} {dec:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
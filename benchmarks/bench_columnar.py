@@ -0,0 +1,61 @@
+"""
+Bytes on the wire and decode time of DB replies as a list per row versus
+columnar ("columnar": true: one array per column under a header), for the
+list_invites and get_comments_by_game_id result sets.
+
+Decode time covers the codec plus turning the reply into rows: nothing for
+the row form (the lobby then indexes room[6]), DBclient's named row objects
+for the columnar one. The synthetic comment texts repeat, so their column
+dictionary-encodes far better than real comments would.
+
+    uv run benchmarks/bench_columnar.py [rows]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "database"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "servers"))
+from DBclient import columnar_rows  # noqa: E402
+from DBserver import _columnar  # noqa: E402
+from utils.TCPutils import CODECS  # noqa: E402
+
+from bench_codec import comments_response  # noqa: E402
+
+COMMENT_COLUMNS = ("id", "name", "content", "score", "timestamp")
+INVITE_COLUMNS = ("roomId", "fromId", "fromName", "id", "roomName", "gameId", "gameName")
+
+
+def invites_response(rows: int) -> dict:
+    # roomId, fromId, fromName, id, roomName, gameId, gameName
+    data = [
+        [i % 40 + 1, i % 90 + 1, f"player_{i % 90}", i, f"room_{i % 40}", i % 7 + 1, f"game_{i % 7}"]
+        for i in range(1, rows + 1)
+    ]
+    return {"status": "ok", "data": data}
+
+
+def measure(codec, payload: dict, to_rows, number: int) -> tuple[int, float]:
+    view = memoryview(codec.encode(payload))
+    dec = min(timeit.repeat(lambda: to_rows(codec.decode(view)), number=number, repeat=3)) / number
+    return len(view), dec * 1e6
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for label, columns, response in (("list_invites", INVITE_COLUMNS, invites_response(rows)),
+                                     ("get_comments_by_game_id", COMMENT_COLUMNS, comments_response(rows))):
+        columnar = {"status": "ok", **_columnar(columns, response["data"])}
+        assert [list(r) for r in columnar_rows(columnar)] == response["data"]
+        print(f"\n{label} ({rows} rows)")
+        print(f"  {'codec':<8} {'layout':<9} {'bytes':>9} {'decode us':>10} {'bytes %':>8} {'time %':>7}")
+        for codec in CODECS.values():
+            size, dec = measure(codec, response, lambda r: r["data"], 200)
+            print(f"  {codec.name:<8} {'rows':<9} {size:>9} {dec:>10.1f}")
+            csize, cdec = measure(codec, columnar, columnar_rows, 200)
+            print(f"  {codec.name:<8} {'columnar':<9} {csize:>9} {cdec:>10.1f}"
+                  f" {100 * (csize - size) / size:>+7.1f}% {100 * (cdec - dec) / dec:>+6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Bandwidth versus CPU for per-frame compression, measured over socketpairs.
+
+Each algorithm gets its own handshaked socketpair. One thread sends the
+same large response repeatedly and the other receives and decodes it.
+
+    uv run benchmarks/bench_compression.py [rows] [frames]
+"""
+import socket
+import sys
+import threading
+import time
+
+from utils.TCPutils import (
+    COMPRESSORS, encode_message, get_session, handshake, recv_json, send_json,
+    set_compress_threshold, _frame_buffers,
+)
+from bench_codec import comments_response, rooms_response
+
+
+def connected_pair(compression: tuple[str, ...]) -> tuple[socket.socket, socket.socket]:
+    client, server = socket.socketpair()
+    # The server side answers the hello from inside recv_json.
+    t = threading.Thread(target=recv_json, args=(server, 5), daemon=True)
+    t.start()
+    handshake(client, codecs=("json",), compression=compression)
+    t.join()
+    return client, server
+
+
+def wire_bytes(sock: socket.socket, payload: dict) -> int:
+    buffers = []
+    _frame_buffers(get_session(sock), encode_message(sock, payload), buffers)
+    return sum(len(b) for b in buffers)
+
+
+def run(compression: tuple[str, ...], payload: dict, frames: int) -> tuple[int, float]:
+    client, server = connected_pair(compression)
+    set_compress_threshold(server, 0)
+
+    def sender():
+        for _ in range(frames):
+            send_json(server, payload)
+
+    start = time.perf_counter()
+    t = threading.Thread(target=sender)
+    t.start()
+    for _ in range(frames):
+        assert recv_json(client, 5) is not None
+    t.join()
+    elapsed = time.perf_counter() - start
+    size = wire_bytes(server, payload)
+    client.close()
+    server.close()
+    return size, elapsed / frames
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    algorithms = [("none", ())] + [(name, (name,)) for name in COMPRESSORS]
+    for label, payload in (("list_rooms", rooms_response(rows)),
+                           ("show_comment", comments_response(rows))):
+        print(f"\n{label} ({rows} rows, {frames} frames)")
+        print(f"  {'compression':<12} {'wire bytes':>12} {'ms/frame':>10} {'ratio':>7}")
+        baseline = None
+        for name, offer in algorithms:
+            size, per_frame = run(offer, payload, frames)
+            baseline = baseline or size
+            print(f"  {name:<12} {size:>12} {per_frame * 1e3:>10.3f} {size / baseline:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Queries per second of SQLiteService for the lobby's query mix, before
+(a fresh connection per statement, rollback journal) and after (WAL and the
+tuned pragmas, a read-only connection pool for SELECTs and a single
+group-committing writer), plus the writer's metrics.
+
+Runs against a seeded scratch copy of the schema, never the real DB.
+
+    uv run benchmarks/bench_db.py [seconds] [threads,...]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "database"))
+from DBinit import migrate  # noqa: E402
+from DBserver import SQLiteService  # noqa: E402
+from queries import QUERIES  # noqa: E402
+
+USERS = 2000
+GAMES = 50
+ROOMS = 300
+
+# (weight, query name, params factory) -- the named queries (queries.py)
+# DBclient sends for the lobby's common paths, roughly in the proportion a
+# busy lobby issues them.
+QUERY_MIX = [
+    (4, "list_all_rooms", lambda r: None),
+    (3, "find_user_by_name_and_password", lambda r: [f"user_{r.randrange(USERS)}", "hash"]),
+    (4, "find_user_by_id", lambda r: [r.randrange(1, USERS + 1)]),
+    (3, "check_user_in_room", lambda r: [r.randrange(1, USERS + 1)]),
+    (3, "list_user_in_room", lambda r: [r.randrange(1, ROOMS + 1)]),
+    (3, "get_room_by_id", lambda r: [r.randrange(1, ROOMS + 1)]),
+    (2, "list_online_users", lambda r: None),
+    # name, passwordHash, status, id
+    (2, "update_user", lambda r: [None, None, r.choice(["online", "offline"]), r.randrange(1, USERS + 1)]),
+    # name, hostUserId, visibility, status, gameId, id
+    (1, "update_room", lambda r: [None, None, None, r.choice(["idle", "playing"]), None, r.randrange(1, ROOMS + 1)]),
+]
+
+
+class OneShotService:
+    """SQLiteService.execute_sql as it was: connect, run, commit, close."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def execute_sql(self, sql, params=None):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cur = conn.cursor()
+            if params:
+                cur.execute(sql, params)
+            else:
+                cur.execute(sql)
+            rows = cur.fetchall()
+            if not sql.strip().lower().startswith("select"):
+                conn.commit()
+            conn.close()
+            return True, rows
+        except Exception as e:
+            return False, str(e)
+
+    def close(self):
+        pass
+
+
+def build_database(path: str) -> None:
+    migrate(path)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO User (name, passwordHash, status, role) VALUES (?, 'hash', ?, 'player')",
+                     [(f"user_{i}", "online" if i % 4 else "offline") for i in range(USERS)])
+    conn.executemany("INSERT INTO Game (name, description, OwnerId, LatestVersion) VALUES (?, 'd', 1, '1.0.0')",
+                     [(f"game_{i}",) for i in range(GAMES)])
+    conn.executemany("INSERT INTO Room (name, hostUserId, visibility, status, gameId) VALUES (?, ?, 'public', 'idle', ?)",
+                     [(f"room_{i}", i + 1, i % GAMES + 1) for i in range(ROOMS)])
+    conn.executemany("INSERT INTO in_room (roomId, userId) VALUES (?, ?)",
+                     [(i % ROOMS + 1, i + 1) for i in range(ROOMS * 3)])
+    conn.commit()
+    conn.close()
+
+
+def worker(service, seconds: float, seed: int, counts: list, errors: list, index: int) -> None:
+    rng = random.Random(seed)
+    weights = [w for w, _, _ in QUERY_MIX]
+    done = failed = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        _, name, params = rng.choices(QUERY_MIX, weights)[0]
+        ok, _ = service.execute_sql(QUERIES[name], params(rng))
+        done += 1
+        failed += not ok
+    counts[index] = done
+    errors[index] = failed
+
+
+def run(service, threads: int, seconds: float) -> tuple[float, int, dict | None]:
+    counts = [0] * threads
+    errors = [0] * threads
+    pool = [threading.Thread(target=worker, args=(service, seconds, i, counts, errors, i)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    metrics = service.metrics() if hasattr(service, "metrics") else None
+    service.close()
+    return sum(counts) / elapsed, sum(errors), metrics
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    thread_counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 4, 16]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"lobby query mix, {seconds:g}s per run")
+        print(f"  {'service':<28} {'threads':>8} {'qps':>10} {'errors':>7}")
+        for label, make in (("connect per statement", OneShotService),
+                            ("reader pool + writer", SQLiteService)):
+            for threads in thread_counts:
+                # Fresh file per run: WAL mode sticks to the database file.
+                path = os.path.join(tmp, f"{label[:4]}_{threads}.db")
+                build_database(path)
+                qps, errors, metrics = run(make(path), threads, seconds)
+                print(f"  {label:<28} {threads:>8} {qps:>10.0f} {errors:>7}")
+                if metrics:
+                    print(f"    commits {metrics['commits']}, writes/commit mean {metrics['commit_batch_mean']}"
+                          f" max {metrics['commit_batch_max']}, max queue {metrics['max_write_queue_depth']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Cost of the TCPutils transport primitives: send_json/recv_json round trips
+and one-way streams, send_file/recv_file, and many concurrent connections,
+over socketpairs and loopback TCP.
+
+Reports throughput, p50/p99 latency and traced memory peaks; --json writes
+the same numbers to a file so runs can be compared.
+
+    uv run benchmarks/bench_transport.py [--quick] [--json results.json]
+                                         [--only messages,files,concurrency]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from utils.TCPutils import file_sha256, handshake, recv_file, recv_json, send_file, send_json
+
+MESSAGE_SIZES = [64, 1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+FILE_SIZES = [1 << 20, 64 << 20, 500 << 20]
+STREAM_COUNTS = [1, 4, 16, 64]
+
+QUICK_MESSAGE_SIZES = [64, 64 * 1024, 1024 * 1024]
+QUICK_FILE_SIZES = [1 << 20, 16 << 20]
+QUICK_STREAM_COUNTS = [1, 8]
+
+
+def tcp_pair() -> tuple[socket.socket, socket.socket]:
+    listener = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+    return client, server
+
+
+TRANSPORTS = {"socketpair": socket.socketpair, "tcp": tcp_pair}
+
+
+def connected_pair(transport: str, negotiated: bool) -> tuple[socket.socket, socket.socket]:
+    client, server = TRANSPORTS[transport]()
+    if negotiated:
+        # Flagged framing, resumable/multiplexed files; no compression so
+        # the payload size is what goes on the wire.
+        t = threading.Thread(target=recv_json, args=(server, 5), daemon=True)
+        t.start()
+        handshake(client, codecs=("json",), compression=())
+        t.join()
+    return client, server
+
+
+def message(size: int) -> dict:
+    # ~size bytes once encoded
+    return {"op": "bench", "data": "x" * max(0, size - 30)}
+
+
+def iterations(size: int, quick: bool) -> int:
+    budget = (16 if quick else 64) * 1024 * 1024
+    return max(5, min(1000 if quick else 5000, budget // size))
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def echo(sock: socket.socket, count: int) -> None:
+    for _ in range(count):
+        send_json(sock, recv_json(sock, 30))
+
+
+def ping_pong(transport: str, negotiated: bool, size: int, iters: int) -> dict:
+    client, server = connected_pair(transport, negotiated)
+    t = threading.Thread(target=echo, args=(server, iters + 1))
+    t.start()
+    msg = message(size)
+    send_json(client, msg)
+    recv_json(client, 30)  # warm up buffers
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        send_json(client, msg)
+        recv_json(client, 30)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    t.join()
+    client.close()
+    server.close()
+    return {
+        "round_trips_per_s": round(iters / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+    }
+
+
+def one_way(transport: str, negotiated: bool, size: int, iters: int) -> dict:
+    client, server = connected_pair(transport, negotiated)
+    msg = message(size)
+
+    def sender():
+        for _ in range(iters):
+            send_json(server, msg)
+
+    start = time.perf_counter()
+    t = threading.Thread(target=sender)
+    t.start()
+    for _ in range(iters):
+        recv_json(client, 30)
+    elapsed = time.perf_counter() - start
+    t.join()
+    client.close()
+    server.close()
+    return {
+        "msgs_per_s": round(iters / elapsed, 1),
+        "mb_per_s": round(iters * size / elapsed / 1e6, 1),
+    }
+
+
+def traced_peak(transport: str, negotiated: bool, size: int, iters: int) -> dict:
+    """Python heap peak while round-tripping, relative to the payload."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        ping_pong(transport, negotiated, size, iters)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_kib": round((peak - before) / 1024, 1), "peak_per_payload": round((peak - before) / size, 2)}
+
+
+def bench_messages(quick: bool) -> list[dict]:
+    results = []
+    print("\nmessages")
+    print(f"  {'transport':<11} {'mode':<10} {'size':>9} {'rt/s':>10} {'p50 us':>9} {'p99 us':>9}"
+          f" {'MB/s':>8} {'peak KiB':>9}")
+    for transport in TRANSPORTS:
+        for negotiated in (False, True):
+            mode = "negotiated" if negotiated else "plain"
+            for size in (QUICK_MESSAGE_SIZES if quick else MESSAGE_SIZES):
+                iters = iterations(size, quick)
+                row = {"transport": transport, "mode": mode, "size": size, "iterations": iters}
+                row.update(ping_pong(transport, negotiated, size, iters))
+                row.update(one_way(transport, negotiated, size, iters))
+                row.update(traced_peak(transport, negotiated, size, max(3, iters // 10)))
+                results.append(row)
+                print(f"  {transport:<11} {mode:<10} {size:>9} {row['round_trips_per_s']:>10} "
+                      f"{row['p50_us']:>9} {row['p99_us']:>9} {row['mb_per_s']:>8} {row['peak_kib']:>9}")
+    return results
+
+
+def write_file(path: str, size: int) -> None:
+    block = os.urandom(1 << 20)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, len(block))])
+            remaining -= len(block)
+
+
+def file_transfer(transport: str, negotiated: bool, path: str, digest: str, out_dir: str) -> dict:
+    client, server = connected_pair(transport, negotiated)
+    size = os.path.getsize(path)
+    # Passing the digest keeps the sender's hashing pass out of the timing;
+    # the receiver still hashes as it writes.
+    data = {"op": "bench_file", "sha256": digest}
+
+    t = threading.Thread(target=send_file, args=(server, path, data))
+    start = time.perf_counter()
+    t.start()
+    _, saved = recv_file(client, out_dir, 120)
+    elapsed = time.perf_counter() - start
+    t.join()
+    client.close()
+    server.close()
+    assert saved is not None and os.path.getsize(saved) == size
+    for name in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, name))
+    return {"seconds": round(elapsed, 3), "mb_per_s": round(size / elapsed / 1e6, 1)}
+
+
+def bench_files(quick: bool, max_file_mb: int | None) -> list[dict]:
+    sizes = QUICK_FILE_SIZES if quick else FILE_SIZES
+    if max_file_mb is not None:
+        sizes = [s for s in sizes if s <= max_file_mb << 20]
+    results = []
+    print("\nfiles")
+    print(f"  {'transport':<11} {'mode':<10} {'size MB':>8} {'seconds':>8} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(out_dir)
+        for size in sizes:
+            path = os.path.join(tmp, f"payload_{size}.bin")
+            write_file(path, size)
+            digest = file_sha256(path)
+            for transport in TRANSPORTS:
+                for negotiated in (False, True):
+                    mode = "negotiated" if negotiated else "plain"
+                    row = {"transport": transport, "mode": mode, "size": size}
+                    row.update(file_transfer(transport, negotiated, path, digest, out_dir))
+                    results.append(row)
+                    print(f"  {transport:<11} {mode:<10} {size >> 20:>8} {row['seconds']:>8} {row['mb_per_s']:>8}")
+            os.remove(path)
+    return results
+
+
+def concurrent(streams: int, size: int, iters: int) -> dict:
+    listener = socket.create_server(("127.0.0.1", 0), backlog=streams)
+    address = listener.getsockname()
+    servers = []
+
+    def accept_all():
+        for _ in range(streams):
+            conn, _ = listener.accept()
+            servers.append(conn)
+            threading.Thread(target=echo, args=(conn, iters), daemon=True).start()
+
+    acceptor = threading.Thread(target=accept_all)
+    acceptor.start()
+    latencies: list[float] = []
+    lock = threading.Lock()
+    msg = message(size)
+    barrier = threading.Barrier(streams + 1)
+
+    def client():
+        sock = socket.create_connection(address)
+        local = []
+        barrier.wait()
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            send_json(sock, msg)
+            recv_json(sock, 30)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+        sock.close()
+
+    clients = [threading.Thread(target=client) for _ in range(streams)]
+    for t in clients:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - start
+    acceptor.join()
+    for conn in servers:
+        conn.close()
+    listener.close()
+    return {
+        "round_trips_per_s": round(streams * iters / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+    }
+
+
+def bench_concurrency(quick: bool) -> list[dict]:
+    results = []
+    size = 1024
+    iters = 200 if quick else 1000
+    print(f"\nconcurrency (tcp, {size} B messages, {iters} round trips per stream)")
+    print(f"  {'streams':>8} {'rt/s':>10} {'p50 us':>9} {'p99 us':>9}")
+    for streams in (QUICK_STREAM_COUNTS if quick else STREAM_COUNTS):
+        row = {"streams": streams, "size": size, "iterations": iters}
+        row.update(concurrent(streams, size, iters))
+        results.append(row)
+        print(f"  {streams:>8} {row['round_trips_per_s']:>10} {row['p50_us']:>9} {row['p99_us']:>9}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer iterations")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    parser.add_argument("--only", default="messages,files,concurrency",
+                        help="comma separated subset of messages,files,concurrency")
+    parser.add_argument("--max-file-mb", type=int, help="skip files larger than this")
+    args = parser.parse_args()
+    suites = set(args.only.split(","))
+
+    results = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": args.quick,
+        },
+    }
+    if "messages" in suites:
+        results["messages"] = bench_messages(args.quick)
+    if "files" in suites:
+        results["files"] = bench_files(args.quick, args.max_file_mb)
+    if "concurrency" in suites:
+        results["concurrency"] = bench_concurrency(args.quick)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ from time import sleep
 from dotenv import load_dotenv
 
 # Import your provided utils including the Exception
-from utils.TCPutils import send_json, recv_file, ConnectionClosedByPeer
+from utils.TCPutils import send_json, recv_file, ConnectionClosedByPeer, handshake, get_session, RpcConnection
 
 # Configuration
 load_dotenv()
@@ -35,6 +35,8 @@ class GameClient:
         self.response_event = threading.Event()
         self.latest_response = {}
         self.latest_file_path = None
+        # Replies are matched to requests by id; set up once connected
+        self.rpc = None
 
         self.start_game_event = threading.Event()
         self.game_set_event = threading.Event()
@@ -45,6 +47,12 @@ class GameClient:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.sock.connect((HOST, PORT))
             print(f"Connected to {HOST}:{PORT}")
+            # Large lists (rooms, games, comments) come back compressed. JSON
+            # first: the binary codec decodes much slower
+            # (benchmarks/bench_codec.py); it is offered so the lobby can
+            # switch to it without a client update
+            handshake(self.sock, codecs=("json", "binary"))
+            self.rpc = RpcConnection(self.sock)
             
             # Start the listener thread
             t = threading.Thread(target=self._listener_task, daemon=True)
@@ -61,6 +69,8 @@ class GameClient:
         Continuously receives messages.
         - If it's a synchronous response, wake up the main thread.
         - If it's an async notification (invite/request), print it immediately.
+        Downloads arrive as data frames interleaved with everything else;
+        recv_file returns each message as it comes and the file once complete.
         """
         while self.running:
             try:
@@ -71,6 +81,13 @@ class GameClient:
                     # None usually implies a timeout if set, or empty read
                     continue
 
+                # Replies to requests (and stale replies to requests that
+                # already timed out) never reach the notification logic,
+                # except "start": the starter's copy answers its request and
+                # still launches the game like everyone else's
+                if self.rpc.dispatch(metadata, file_path) and metadata.get("op") != "start":
+                    continue
+
                 op = metadata.get("op")
                 
                 # List of ops that are async notifications
@@ -134,13 +151,26 @@ class GameClient:
         self.latest_response = {}
         self.latest_file_path = None
         
-        send_json(self.sock, payload)
-        
-        # Wait for the listener to set the event
-        if not self.response_event.wait(timeout=10.0):
-            print("[Error] Server timed out.")
-            return None, None
+        future = self.rpc.request(payload)
+        future.add_done_callback(lambda _: self.response_event.set())
         
+        # Wait for the reply (or for the listener to set the event, e.g. a
+        # "start" notification), for as long as a download is still
+        # streaming in: every 10 s without a reply must bring more of it.
+        # A transfer the server gave up on never completes.
+        received = None
+        while not self.response_event.wait(timeout=10.0):
+            incoming = list(get_session(self.sock).incoming.values())
+            progress = sum(transfer.have for transfer in incoming)
+            if not incoming or progress == received:
+                print("[Error] Server timed out.")
+                self.rpc.cancel(future)
+                return None, None
+            received = progress
+
+        if future.done():
+            return future.result()
+        self.rpc.cancel(future)
         return self.latest_response, self.latest_file_path
 
     #start game logic
@@ -1,6 +1,10 @@
 import sqlite3
 import os
+import pathlib
+import re
+import sys
 from dotenv import load_dotenv
+from queries import QUERIES, HOT_QUERIES
 
 load_dotenv()
 db_path = os.getenv("DB_PATH","src/database/data/database.db")
@@ -104,6 +108,193 @@ def initialize_database(db_path: str):
     conn.commit()
     conn.close()
 
+# Schema Migrations
+#
+# initialize_database() is the base schema (version 0). Everything after it
+# is an ordered migration; the version applied last lives in the database
+# itself (PRAGMA user_version). Never edit a released migration: add one.
+
+MIGRATIONS = [
+    (1, "indexes for the DatabaseClient lookups", """
+        CREATE INDEX IF NOT EXISTS idx_user_name ON User(name);
+        CREATE INDEX IF NOT EXISTS idx_user_status ON User(status);
+        CREATE INDEX IF NOT EXISTS idx_game_name ON Game(name);
+        CREATE INDEX IF NOT EXISTS idx_game_owner ON Game(OwnerId);
+        CREATE INDEX IF NOT EXISTS idx_in_room_user ON in_room(userId);
+        CREATE INDEX IF NOT EXISTS idx_invite_to ON invite_list(toId);
+        CREATE INDEX IF NOT EXISTS idx_invite_from ON invite_list(fromId);
+        CREATE INDEX IF NOT EXISTS idx_request_from ON request_join_list(fromId);
+        CREATE INDEX IF NOT EXISTS idx_request_to ON request_join_list(toId);
+        CREATE INDEX IF NOT EXISTS idx_version_game ON GameVersion(gameId, VersionNumber);
+        CREATE INDEX IF NOT EXISTS idx_comment_game ON comment(gameId, timestamp);
+    """),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path: str) -> int:
+    """
+    Create the base tables if needed, then apply every migration newer than
+    the database's version, each in its own transaction. Returns the version.
+    """
+    initialize_database(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        version = schema_version(conn)
+        for number, description, script in MIGRATIONS:
+            if number <= version:
+                continue
+            try:
+                conn.executescript(f"BEGIN IMMEDIATE; {script}; PRAGMA user_version = {number}; COMMIT;")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            version = number
+        return version
+    finally:
+        conn.close()
+
+# Hot Store
+#
+# With DB_HOT_STORE=1 the DB server keeps the lobby's short-lived state in
+# an in-memory database attached to every connection as "hot": rooms, who
+# is in them, invites, join requests and each user's online status. None
+# of it outlives the server, so it starts empty on every start and writing
+# it never touches the disk. User, Game, GameVersion and comment stay in
+# the file and join with it as usual.
+
+# On disk, these stay behind, unused, while the hot store is on
+HOT_TABLES = ("Room", "in_room", "invite_list", "request_join_list")
+_HOT_TABLE_RE = re.compile(r"(?<![.\w])(" + "|".join(HOT_TABLES) + r")\b")
+
+# No foreign keys into main: sqlite can't enforce them across databases
+HOT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS hot.Room (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        hostUserId INTEGER NOT NULL,
+        visibility TEXT CHECK(visibility IN ('public','private')) NOT NULL,
+        status TEXT CHECK(status IN ('idle','playing')) NOT NULL,
+        gameId INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS hot.in_room (
+        roomId INTEGER NOT NULL,
+        userId INTEGER NOT NULL,
+        PRIMARY KEY(roomId, userId),
+        FOREIGN KEY(roomId) REFERENCES Room(id)
+    );
+    CREATE TABLE IF NOT EXISTS hot.invite_list (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        roomId INTEGER NOT NULL,
+        fromId INTEGER NOT NULL,
+        toId INTEGER NOT NULL,
+        FOREIGN KEY(roomId) REFERENCES Room(id)
+    );
+    CREATE TABLE IF NOT EXISTS hot.request_join_list (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        roomId INTEGER NOT NULL,
+        fromId INTEGER NOT NULL,
+        toId INTEGER NOT NULL,
+        FOREIGN KEY(roomId) REFERENCES Room(id)
+    );
+    -- Users without a row here are offline
+    CREATE TABLE IF NOT EXISTS hot.user_status (
+        userId INTEGER PRIMARY KEY,
+        status TEXT CHECK(status IN ('online','offline')) NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS hot.idx_in_room_user ON in_room(userId);
+    CREATE INDEX IF NOT EXISTS hot.idx_invite_to ON invite_list(toId);
+    CREATE INDEX IF NOT EXISTS hot.idx_invite_from ON invite_list(fromId);
+    CREATE INDEX IF NOT EXISTS hot.idx_request_from ON request_join_list(fromId);
+    CREATE INDEX IF NOT EXISTS hot.idx_request_to ON request_join_list(toId);
+    CREATE INDEX IF NOT EXISTS hot.idx_user_status ON user_status(status);
+"""
+
+# Per connection, for the hot-store variants of the User queries
+# (queries.HOT_QUERIES): user_state is User with its status read from
+# hot.user_status, and a row inserted into user_changes updates a user
+# (NULL fields stay as they are). A status change only writes the
+# in-memory row. (An UPDATE of user_state would work too, but sqlite
+# materializes the whole view to run it.)
+_USER_STATE_SQL = """
+    CREATE TEMP VIEW IF NOT EXISTS user_state AS
+        SELECT U.id, U.name, U.passwordHash, COALESCE(S.status, 'offline') AS status, U.role
+        FROM main.User U LEFT JOIN hot.user_status S ON S.userId = U.id;
+    CREATE TEMP VIEW IF NOT EXISTS user_changes AS
+        SELECT id, name, passwordHash, status FROM main.User WHERE 0;
+    CREATE TEMP TRIGGER IF NOT EXISTS user_changes_insert INSTEAD OF INSERT ON user_changes BEGIN
+        UPDATE User SET name = COALESCE(NEW.name, name), passwordHash = COALESCE(NEW.passwordHash, passwordHash)
+            WHERE id = NEW.id AND (NEW.name IS NOT NULL OR NEW.passwordHash IS NOT NULL);
+        INSERT INTO user_status (userId, status)
+            SELECT NEW.id, NEW.status WHERE NEW.status IS NOT NULL AND EXISTS (SELECT 1 FROM User WHERE id = NEW.id)
+            ON CONFLICT(userId) DO UPDATE SET status = excluded.status;
+    END;
+"""
+
+
+def attach_hot_store(conn: sqlite3.Connection, name: str) -> None:
+    """
+    Attach the in-memory database `name` as "hot" and create what's missing
+    in it. Every connection attaching the same name in this process shares
+    it (shared cache); it is gone once the last one closes.
+
+    `conn` must have been opened with uri=True: otherwise sqlite takes the
+    URI for a file name and this raises rather than leave that file behind.
+    """
+    conn.execute(f"ATTACH DATABASE 'file:{name}?mode=memory&cache=shared' AS hot")
+    files = {db: file for _, db, file in conn.execute("PRAGMA database_list")}
+    if files["hot"]:
+        conn.execute("DETACH DATABASE hot")
+        os.remove(files["hot"])
+        raise ValueError("The hot store needs a connection opened with uri=True")
+    conn.executescript(HOT_SCHEMA + _USER_STATE_SQL)
+
+
+def hot_sql(sql: str) -> str:
+    """The statement with the HOT_TABLES it names moved to the hot store."""
+    return _HOT_TABLE_RE.sub(r"hot.\1", sql)
+
+# Query Plan Check
+
+# Named queries that return a whole table on purpose
+FULL_SCAN_OK = {"list_all_rooms", "list_all_games"}
+
+
+def find_full_scans(db_path: str) -> list[tuple[str, str]]:
+    """
+    EXPLAIN QUERY PLAN every named query (see queries.py) against a
+    migrated database, and again as the DB server runs them with the hot
+    store on; returns (query, plan step) for each full table scan outside
+    FULL_SCAN_OK. An empty list means every lookup uses an index.
+    """
+    conn = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri(), uri=True)
+    try:
+        scans = _full_scans(conn, QUERIES)
+        attach_hot_store(conn, f"plancheck-{os.getpid()}-{id(conn)}")
+        hot = {name: hot_sql(sql) for name, sql in {**QUERIES, **HOT_QUERIES}.items()}
+        scans += [(f"{name} (hot store)", detail) for name, detail in _full_scans(conn, hot)]
+        return scans
+    finally:
+        conn.close()
+
+
+def _full_scans(conn: sqlite3.Connection, queries: dict) -> list[tuple[str, str]]:
+    scans = []
+    for name, sql in queries.items():
+        if name in FULL_SCAN_OK:
+            continue
+        params = [1] * sql.count("?")
+        for _, _, _, detail in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            # "SCAN R", "SCAN I USING COVERING INDEX ..." read every row;
+            # "SEARCH ..." and "SCAN CONSTANT ROW" do not.
+            if re.match(r"SCAN (?!CONSTANT ROW)", detail):
+                scans.append((name, detail))
+    return scans
+
 # Fake Data Initialization
 
 def seed_fake_data(db_path: str):
@@ -135,5 +326,13 @@ def seed_fake_data(db_path: str):
 
 
 if __name__ == '__main__':
-    initialize_database(db_path)
+    print(f"Schema version {migrate(db_path)}")
+    if "--check-plans" in sys.argv:
+        # Exits non-zero if a lookup would read a whole table
+        scans = find_full_scans(db_path)
+        for name, detail in scans:
+            print(f"FULL SCAN in {name}: {detail}")
+        if scans:
+            sys.exit(1)
+        print("Every query uses an index")
     # seed_fake_data(db_path)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Named queries the DB server runs on behalf of DatabaseClient.
+
+Clients send {"q": <name>, "params": [...]} instead of SQL text: only these
+statements can run, and since the text never changes per name each one is
+parsed once per connection and then served from sqlite's statement cache.
+
+Optional fields in the UPDATE queries are COALESCE(?, column): pass None to
+keep the current value.
+
+A batch request ({"steps": [{"q": ..., "params": [...]}, ...]}) runs several
+of these in one transaction. A param of {"ref": [step, row, col]} stands
+for a value an earlier step returned, or NULL if that step returned no such
+row.
+
+A request with "columnar": true gets its rows back as one array per column
+under "data", after the column names ("columns") and sqlite types ("types").
+A text column that mostly repeats comes as {"values": [...], "index": [...]}
+instead, row i holding values[index[i]].
+Result columns are named after their AS aliases, so keep those unique.
+"""
+
+QUERIES = {
+    # --- User ---
+    "find_user_by_name_and_password":
+        "SELECT id, name, passwordHash,status, role FROM User WHERE name = ? AND passwordHash = ? LIMIT 1",
+    "find_user_by_id":
+        "SELECT id, name, passwordHash, status, role FROM User WHERE id = ? LIMIT 1",
+    "insert_user":
+        "INSERT INTO User (name, passwordHash, role) VALUES (?, ?, ?)",
+    "update_user":
+        "UPDATE User SET name = COALESCE(?, name), passwordHash = COALESCE(?, passwordHash), "
+        "status = COALESCE(?, status) WHERE id = ?",
+    "list_online_users":
+        "SELECT * FROM User WHERE status = 'online' AND role != 'developer'",
+
+    # --- Room ---
+    "list_all_rooms":
+        "SELECT R.id, R.name, R.hostUserId, R.visibility, R.status, R.gameId, G.name AS gameName FROM Room R JOIN Game G ON R.gameId = G.id",
+    "create_room":
+        "INSERT INTO Room (name, hostUserId, visibility, status, gameId) VALUES (?, ?, ?, ?,?) RETURNING id",
+    "add_room_host":
+        "INSERT INTO in_room (roomId, userId) VALUES (?, ?) RETURNING *",
+    "get_room_by_id":
+        "SELECT * FROM Room WHERE id = ? ",
+    "get_room_by_id_and_visibility":
+        "SELECT * FROM Room WHERE id = ? AND visibility = ?",
+    "update_room":
+        "UPDATE Room SET name = COALESCE(?, name), hostUserId = COALESCE(?, hostUserId), "
+        "visibility = COALESCE(?, visibility), status = COALESCE(?, status), gameId = COALESCE(?, gameId) "
+        "WHERE id = ? RETURNING *",
+    "delete_room":
+        "DELETE FROM Room WHERE id = ? RETURNING id",
+    # (room_id, room_id): only once the last member has left
+    "delete_room_if_empty":
+        "DELETE FROM Room WHERE id = ? AND NOT EXISTS (SELECT 1 FROM in_room WHERE roomId = ?) RETURNING id",
+
+    # --- in_room ---
+    "check_user_in_room":
+        "SELECT roomId FROM in_room WHERE userId = ?",
+    "add_user_to_room":
+        "INSERT INTO in_room (roomId, userId) VALUES (?, ?) RETURNING roomId",
+    "leave_room":
+        "DELETE FROM in_room WHERE userId = ? RETURNING roomId",
+    "list_user_in_room":
+        "SELECT U.id, U.name from in_room as I , User as U where I.userId = U.id AND I.roomId  = ? ",
+
+    # --- invite_list ---
+    "add_invite":
+        "INSERT INTO invite_list (roomId, fromId, toId) VALUES (?, ?, ?) RETURNING id",
+    "get_invite_by_id":
+        "SELECT * FROM invite_list WHERE id = ? ",
+    "remove_invite_by_id":
+        "DELETE FROM invite_list WHERE id = ? RETURNING * ",
+    "remove_invite_by_toid":
+        "DELETE FROM invite_list WHERE toId = ? RETURNING * ",
+    "remove_invite_by_fromid":
+        "DELETE FROM invite_list WHERE fromId = ? RETURNING * ",
+    "list_invites":
+        """
+            SELECT I.roomId, I.fromId, U.name as fromName, I.id, R.name as roomName, R.gameId, G.name as gameName
+            FROM invite_list as I
+            JOIN User as U ON I.fromId = U.id
+            JOIN Room as R ON I.roomId = R.id
+            JOIN Game as G ON R.gameId = G.id
+            WHERE I.toId = ?
+        """,
+
+    # --- request_join_list ---
+    "insert_request":
+        "INSERT INTO request_join_list (roomId, fromId, toId) VALUES (?, ?, ?) RETURNING id",
+    "get_request_by_id":
+        "SELECT * FROM request_join_list WHERE id = ? ",
+    "get_request_by_id_and_toid":
+        "SELECT * FROM request_join_list WHERE id = ?  AND toId = ?",
+    "remove_request_by_id":
+        "DELETE FROM request_join_list WHERE id = ? RETURNING * ",
+    "remove_request_by_fromid":
+        "DELETE FROM request_join_list WHERE fromId = ? RETURNING * ",
+    "remove_request_by_toid":
+        "DELETE FROM request_join_list WHERE toId = ? RETURNING * ",
+    "list_requests":
+        "SELECT R.roomId , U.id, U.name , R.id FROM request_join_list AS R , User AS U WHERE R.fromId = U.id AND  toId = ?",
+
+    # --- Game ---
+    "list_all_games":
+        "SELECT id, name FROM Game",
+    "get_game_by_id":
+        "SELECT * FROM Game WHERE id = ? LIMIT 1",
+    "get_game_by_name":
+        "SELECT * FROM Game WHERE name = ? LIMIT 1",
+    "get_all_games_by_ownerid":
+        "SELECT * FROM Game WHERE OwnerID = ?",
+    "insert_game":
+        "INSERT INTO Game (name, description, OwnerID, LatestVersion, min_players, max_players) VALUES (?, ?, ?, ?, ?, ?) RETURNING id",
+    "update_game":
+        "UPDATE Game SET LatestVersion = COALESCE(?, LatestVersion), description = COALESCE(?, description), "
+        "min_players = COALESCE(?, min_players), max_players = COALESCE(?, max_players) WHERE id = ? RETURNING *",
+    "delete_game_by_id":
+        "DELETE FROM Game WHERE id = ? RETURNING *",
+
+    # --- GameVersion ---
+    "insert_game_version":
+        "INSERT INTO GameVersion (gameId, VersionNumber, command) VALUES (?, ?, ?) RETURNING *",
+    "get_version_by_gameid_and_version":
+        "SELECT * FROM GameVersion WHERE gameId = ? AND VersionNumber = ? LIMIT 1",
+    "get_versions_by_game_id":
+        "SELECT VersionNumber FROM GameVersion WHERE gameId = ?",
+    "get_ordered_versions_by_gameid":
+        "SELECT * FROM GameVersion WHERE gameId = ? ORDER BY UploadDate DESC",
+    "delete_game_version_by_id":
+        "DELETE FROM GameVersion WHERE id = ? RETURNING *",
+    "delete_all_versions_by_gameid":
+        "DELETE FROM GameVersion WHERE gameId = ? RETURNING *",
+
+    # --- comment ---
+    "insert_comment":
+        """
+            INSERT INTO comment (gameId, userId, content, score)
+            VALUES (?, ?, ?, ?) RETURNING *
+        """,
+    "get_average_score":
+        "SELECT AVG(score) FROM comment WHERE gameId = ?",
+    "get_comments_by_game_id":
+        """
+            SELECT c.id, u.name, c.content, c.score, c.timestamp
+            FROM comment c
+            JOIN User u ON c.userId = u.id
+            WHERE c.gameId = ?
+            ORDER BY c.timestamp DESC
+        """,
+}
+
+# Named SELECTs the DB server never serves from its result cache
+UNCACHED_QUERIES = {
+    # Credentials: don't keep password hashes around keyed by the password
+    "find_user_by_name_and_password",
+}
+
+# Replacements used when the DB server runs with the hot store
+# (DB_HOT_STORE=1, see DBinit): user status lives in memory, behind the
+# user_state and user_changes views. Same params and result columns as the
+# QUERIES they replace.
+HOT_QUERIES = {
+    "find_user_by_name_and_password":
+        "SELECT id, name, passwordHash, status, role FROM user_state WHERE name = ? AND passwordHash = ? LIMIT 1",
+    "find_user_by_id":
+        "SELECT id, name, passwordHash, status, role FROM user_state WHERE id = ? LIMIT 1",
+    "update_user":
+        "INSERT INTO user_changes (name, passwordHash, status, id) VALUES (?, ?, ?, ?)",
+    "list_online_users":
+        "SELECT U.id, U.name, U.passwordHash, S.status, U.role FROM user_status S JOIN User U ON U.id = S.userId "
+        "WHERE S.status = 'online' AND U.role != 'developer'",
+}
@@ -46,6 +46,10 @@ class DeveloperClient:
         """Establishes connection and starts the listener thread."""
         try:
             self.sock = TCPutils.create_tcp_socket(self.host, self.port)
+            # Large game lists come back compressed. JSON first: the binary
+            # codec decodes much slower (benchmarks/bench_codec.py); it is
+            # offered so the lobby can switch to it without a client update
+            TCPutils.handshake(self.sock, codecs=("json", "binary"))
             self.running = True
             print(f"[CLIENT] Connected to {self.host}:{self.port}")
             
@@ -382,7 +386,11 @@ class DeveloperClient:
             if zip_path:
                 try:
                     print(f"   [...] Uploading {folder}...")
-                    TCPutils.send_file(self.sock, zip_path, {"op": "upload_game"})
+                    # The zip is rebuilt deterministically, so a retried upload of the
+                    # same folder maps to the same transfer and resumes the partial one.
+                    digest = TCPutils.file_sha256(zip_path)
+                    TCPutils.send_file(self.sock, zip_path, {"op": "upload_game", "sha256": digest},
+                                       transfer_id=digest[:32])
                 finally:
                     if os.path.exists(zip_path): os.remove(zip_path)
 
@@ -399,7 +407,9 @@ class DeveloperClient:
             if zip_path:
                 try:
                     print(f"   [...] Sending update for {game_name}...")
-                    TCPutils.send_file(self.sock, zip_path, {"op": "update_game"})
+                    digest = TCPutils.file_sha256(zip_path)
+                    TCPutils.send_file(self.sock, zip_path, {"op": "update_game", "sha256": digest},
+                                       transfer_id=digest[:32])
                 finally:
                     if os.path.exists(zip_path): os.remove(zip_path)
 
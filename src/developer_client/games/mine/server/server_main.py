@@ -14,6 +14,9 @@ class MinesweeperServer:
         self.clients = []
         self.player_data = {} 
         self.lock = threading.Lock()
+        # sock -> encoded lines waiting for that client's sender thread
+        self.outbox = {}
+        self.outbox_cond = threading.Condition()
         
         self.board = [] 
         self.revealed = set() 
@@ -44,21 +47,40 @@ class MinesweeperServer:
                 self.board[r][c] = count
 
     def broadcast(self, message):
-        data = json.dumps(message) + "\n"
-        dead_clients = []
-        for client in self.clients:
+        self.broadcast_many([message])
+
+    def broadcast_many(self, messages):
+        # Encoded once for everyone and only queued here: each client's
+        # sender thread writes what has piled up in one sendall, so a slow
+        # client never holds up the others (or the move being processed)
+        data = "".join(json.dumps(m) + "\n" for m in messages).encode('utf-8')
+        with self.outbox_cond:
+            for client in self.clients:
+                self.outbox.setdefault(client, []).append(data)
+            self.outbox_cond.notify_all()
+
+    def send_loop(self, client_sock):
+        while True:
+            with self.outbox_cond:
+                while not self.outbox.get(client_sock):
+                    if client_sock not in self.clients:
+                        return
+                    self.outbox_cond.wait()
+                pending = self.outbox.pop(client_sock)
             try:
-                client.sendall(data.encode('utf-8'))
-            except:
-                dead_clients.append(client)
-        for dc in dead_clients:
-            self.remove_client(dc)
+                client_sock.sendall(b"".join(pending))
+            except OSError:
+                self.remove_client(client_sock)
+                return
 
     def remove_client(self, sock):
         if sock in self.clients:
             self.clients.remove(sock)
             if sock in self.player_data:
                 del self.player_data[sock]
+        with self.outbox_cond:
+            self.outbox.pop(sock, None)
+            self.outbox_cond.notify_all()
 
     def handle_client(self, client_sock):
         buffer = ""
@@ -168,7 +190,7 @@ class MinesweeperServer:
                 # Broadcast all updates (Flood fill might generate many)
                 for update in updates_to_broadcast:
                     update['type'] = 'UPDATE'
-                    self.broadcast(update)
+                self.broadcast_many(updates_to_broadcast)
 
                 # Check End Game
                 if self.revealed_safe_count >= self.total_safe_cells:
@@ -235,6 +257,7 @@ class MinesweeperServer:
             self.clients.append(c)
             self.player_data[c] = {'score': 0, 'id': '', 'name': ''}
             threading.Thread(target=self.handle_client, args=(c,), daemon=True).start()
+            threading.Thread(target=self.send_loop, args=(c,), daemon=True).start()
         
         while not self.game_over: time.sleep(1)
         time.sleep(2)
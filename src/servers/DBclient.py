@@ -1,6 +1,8 @@
 import socket
 import struct
-from utils.TCPutils import create_tcp_socket, send_json, recv_json
+from collections import namedtuple
+from contextlib import contextmanager
+from utils.TCPutils import create_tcp_socket, handshake, RpcConnection
 
 """
 database schema
@@ -15,24 +17,170 @@ class DBclientException(Exception):
     def __init__(self, *args):
         super().__init__(*args)
 
+class Batch:
+    """
+    Named queries collected inside DatabaseClient.batch(). They are sent in
+    one request and run in one transaction when the block exits.
+    """
+    def __init__(self):
+        self.steps = []
+        self.results = None
+
+    def add(self, query: str, params: list = None) -> int:
+        """Queue a named query; returns its step number."""
+        self.steps.append({"q": query, "params": params or []})
+        return len(self.steps) - 1
+
+    @staticmethod
+    def ref(step: int, row: int = 0, col: int = 0) -> dict:
+        """A param standing for rows[row][col] of an earlier step (NULL if there is no such row)."""
+        return {"ref": [step, row, col]}
+
+    def __getitem__(self, step: int) -> list[list]:
+        """Rows returned by a step, once the batch has run."""
+        return self.results[step]
+
+_ROW_TYPES = {}
+
+def row_type(columns: tuple):
+    """
+    Row class for a result header: a namedtuple (empty __slots__, no per-row
+    dict) with the column names as fields, so rows read as row.gameName and
+    still index like the plain row lists. Duplicate or non-identifier
+    names become _<position>.
+    """
+    cls = _ROW_TYPES.get(columns)
+    if cls is None:
+        cls = _ROW_TYPES[columns] = namedtuple("Row", columns, rename=True)
+    return cls
+
+def _column(values):
+    # Dictionary encoded: {"values": distinct, "index": [...]}
+    if isinstance(values, dict):
+        return list(map(values["values"].__getitem__, values["index"]))
+    return values
+
+def columnar_rows(resp: dict, row_cls=None) -> list:
+    """Rows of a columnar reply ({"columns", "types", "data"}) as row_type() objects."""
+    row_cls = row_cls or row_type(tuple(resp["columns"]))
+    return list(map(row_cls._make, zip(*map(_column, resp["data"]))))
+
 class DatabaseClient:
     def __init__(self, host: str, port: int):
         self.host = host
         self.port = port
         self.socket = None
+        self.rpc = None
         self.connect_db()
 
     def connect_db(self):
         self.socket = create_tcp_socket(self.host,self.port)
+        # JSON first: faster to decode than the binary codec (see DBServer)
+        handshake(self.socket, ("json", "binary"))
+        self.rpc = RpcConnection(self.socket)
+
+    def _call(self, req: dict):
+        try:
+            # Replies are matched by request id: one that arrives after the
+            # timeout is dropped instead of answering the next query.
+            response, _ = self.rpc.call(req, timeout=1)
+        except TimeoutError:
+            return None
+        return response
 
-    def _send_request(self, sql: str, params: list = None):
-        """Internal method to send a SQL request to the database server."""
+    def _send_request(self, query: str, params: list = None, cache: bool = True, columnar: bool = False):
+        """
+        Internal method to run one of the server's named queries
+        (see src/database/queries.py) with positional params.
+        cache=False makes the server skip its result cache for this call;
+        columnar=True asks for the rows column by column (see query_rows).
+        """
         if params is None:
             params = []
-        s = self.socket
-        send_json(s,{"sql": sql, "params": params})
-        response = recv_json(s,1)
-        return response
+        req = {"q": query, "params": params}
+        if not cache:
+            req["cache"] = False
+        if columnar:
+            req["columnar"] = True
+        return self._call(req)
+
+    def query_rows(self, query: str, params: list = None, cache: bool = True):
+        """
+        Run a named query and return its rows as row_type() objects, with
+        fields named after the result columns. The server sends them as
+        one array per column, which is smaller and quicker to decode than
+        a list per row. None if the server did not answer.
+        """
+        resp = self._send_request(query, params, cache, columnar=True)
+        if resp is None:
+            return None
+        if resp.get("status") != "ok":
+            raise DBclientException(resp.get("error"))
+        if "columns" not in resp:
+            # Callers read fields by name: plain lists would only fail later
+            raise DBclientException(f"{query}: DB server sent no column names")
+        return columnar_rows(resp)
+
+    def iter_query(self, query: str, params: list = None, page: int = 256):
+        """
+        Yield the rows of a named SELECT through a server-side cursor, one
+        page per round trip. The next page is only asked for once this one
+        has been consumed, so a slow reader never has more than `page` rows
+        in flight; closing the generator early closes the cursor.
+        Rows are row_type() objects, as from query_rows().
+        """
+        resp = self._call({"q": query, "params": params or [], "cursor": page, "columnar": True})
+        cursor_id = row_cls = None
+        try:
+            while True:
+                if resp is None:
+                    raise DBclientException("DB server did not answer")
+                if resp.get("status") != "ok":
+                    # The server has already dropped a cursor that failed
+                    cursor_id = None
+                    raise DBclientException(resp.get("error"))
+                cursor_id = None if resp.get("done") else resp.get("cursor")
+                if row_cls is None:
+                    if "columns" not in resp:
+                        # Callers read fields by name: plain lists would only fail later
+                        raise DBclientException(f"{query}: DB server sent no column names")
+                    row_cls = row_type(tuple(resp["columns"]))
+                yield from columnar_rows(resp, row_cls)
+                if cursor_id is None:
+                    return
+                # Later pages come without the header
+                resp = self._call({"fetch": cursor_id, "n": page, "columnar": True})
+        finally:
+            if cursor_id is not None:
+                try:
+                    self._call({"close": cursor_id})
+                except OSError:
+                    pass  # connection gone: the server drops its cursors with it
+
+    @contextmanager
+    def batch(self):
+        """
+        Run several named queries in one round trip and one transaction:
+
+            with db.batch() as b:
+                room = b.add("create_room", [...])
+                b.add("add_room_host", [b.ref(room), host_id])
+            room_id = b[room][0][0]
+
+        Raises DBclientException (and nothing is committed) if any step fails.
+        """
+        b = Batch()
+        yield b
+        if not b.steps:
+            b.results = []
+            return
+        resp = self._call({"steps": b.steps})
+        if resp is None:
+            raise DBclientException("Batch timed out")
+        if resp.get("status") != "ok":
+            raise DBclientException(resp.get("error"))
+        b.results = resp.get("data")
+
     def close(self):
         self.socket.close()
 
@@ -42,8 +190,7 @@ class DatabaseClient:
         Returns: id, name, hostUserId, visibility, status, gameId, gameName
         """
         # Modified to join with Game table to get gameName
-        sql = "SELECT R.id, R.name, R.hostUserId, R.visibility, R.status, R.gameId, G.name FROM Room R JOIN Game G ON R.gameId = G.id"
-        resp =  self._send_request(sql)
+        resp =  self._send_request("list_all_rooms")
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -51,14 +198,23 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
         return resp
 
+    def iter_all_rooms(self):
+        """
+        Iterate over all rooms without loading them all at once.
+        Yields: id, name, hostUserId, visibility, status, gameId, gameName
+        """
+        return self.iter_query("list_all_rooms")
+
     def execute_raw_sql(self, sql: str, params: list = None):
-        """Execute raw SQL on the database server."""
-        return self._send_request(sql, params)
+        """
+        Execute raw SQL on the database server.
+        Only works against a server started with DB_ALLOW_RAW_SQL=1.
+        """
+        return self._call({"sql": sql, "params": params or []})
     
     def find_user_by_name_and_password(self, name: str, passwordHash : str):
         """Find a user by name."""
-        sql = "SELECT id, name, passwordHash,status, role FROM User WHERE name = ? AND passwordHash = ? LIMIT 1"
-        resp = self._send_request(sql, [name,passwordHash])
+        resp = self._send_request("find_user_by_name_and_password", [name,passwordHash])
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -68,9 +224,8 @@ class DatabaseClient:
 
     def insert_user(self, name: str, password_hash: str,role: str):
         """Insert a new user into the User table."""
-        sql = "INSERT INTO User (name, passwordHash, role) VALUES (?, ?, ?)"
         params = [name, password_hash,role]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("insert_user", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -80,26 +235,15 @@ class DatabaseClient:
     
     def update_user(self, user_id: int, name: str = None, password_hash: str = None, status: str = None):
         """Update specified fields of a user by id."""
-        fields = []
-        params = []
-
-        if name is not None:
-            fields.append("name = ?")
-            params.append(name)
-        if password_hash is not None:
-            fields.append("passwordHash = ?")
-            params.append(password_hash)
-        if status is not None:
-            fields.append("status = ?")
-            params.append(status)
+        # None leaves the column as it is (COALESCE on the server)
+        params = [name, password_hash, status]
 
-        if not fields:
+        if all(p is None for p in params):
             raise ValueError("No fields provided to update")
 
-        sql = f"UPDATE User SET {', '.join(fields)} WHERE id = ?"
         params.append(user_id)
 
-        resp = self._send_request(sql, params)
+        resp = self._send_request("update_user", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -109,8 +253,7 @@ class DatabaseClient:
     
     def list_online_users(self)-> list[list] :
         """List all users with status 'online', excluding developers."""
-        sql = "SELECT * FROM User WHERE status = 'online' AND role != 'developer'"
-        resp = self._send_request(sql)
+        resp = self._send_request("list_online_users")
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -119,31 +262,15 @@ class DatabaseClient:
         return resp
     
     def create_room (self, name :str , hostUserId : int, visibility : str, status : str, gameId: int) -> int:
-        sql = "INSERT INTO Room (name, hostUserId, visibility, status, gameId) VALUES (?, ?, ?, ?,?) RETURNING id"
-        params = [name, hostUserId, visibility, status,gameId]
-        resp = self._send_request(sql, params)
-        
-        room_id = -1
-        if isinstance(resp, dict):
-            if resp.get("status") == "ok":
-                room_id = resp.get("data")
-            else:
-                raise DBclientException(resp.get("error"))
-        
-        sql = "INSERT INTO in_room (roomId, userId) VALUES (?, ?) RETURNING *"
-        params = [room_id[0][0], hostUserId]
-        resp = self._send_request(sql, params)
-       
-        if isinstance(resp, dict):
-            if resp.get("status") == "ok":
-                return room_id
-            else:
-                raise DBclientException(resp.get("error"))
+        # The room and its host's membership are created together or not at all
+        with self.batch() as b:
+            room = b.add("create_room", [name, hostUserId, visibility, status, gameId])
+            b.add("add_room_host", [b.ref(room), hostUserId])
+        return b[room]
             
     def check_user_in_room(self, userId: int) -> list[list]:
-        sql = "SELECT roomId FROM in_room WHERE userId = ?"
         params = [userId]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("check_user_in_room", params)
        
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
@@ -153,9 +280,8 @@ class DatabaseClient:
         return resp
 
     def leave_room(self, userId: int) -> list[list]:
-        sql = "DELETE FROM in_room WHERE userId = ? RETURNING roomId"
         params = [userId]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("leave_room", params)
       
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
@@ -165,9 +291,8 @@ class DatabaseClient:
         return resp
         
     def list_user_in_room(self, room_id: int) -> list [list]:
-        sql = "SELECT U.id, U.name from in_room as I , User as U where I.userId = U.id AND I.roomId  = ? "
         params = [room_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("list_user_in_room", params)
   
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
@@ -177,9 +302,8 @@ class DatabaseClient:
         return resp
        
     def delete_room(self, room_id: int) -> list[list]:
-        sql = "DELETE FROM Room WHERE id = ? RETURNING id"
         params = [room_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("delete_room", params)
         
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
@@ -189,9 +313,8 @@ class DatabaseClient:
         return resp
     
     def add_invite(self,roomId:int,invitee_id:int , from_id : int) -> list[list]:
-        sql = "INSERT INTO invite_list (roomId, fromId, toId) VALUES (?, ?, ?) RETURNING id"
         params = [roomId, from_id, invitee_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("add_invite", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -199,9 +322,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
 
     def find_user_by_id(self, user_id: int) -> list[list]:
-        sql = "SELECT id, name, passwordHash, status, role FROM User WHERE id = ? LIMIT 1"
         params = [user_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("find_user_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -210,9 +332,8 @@ class DatabaseClient:
         return resp
     
     def add_user_to_room(self, roomId:int, userId:int) -> list[list]:
-        sql = "INSERT INTO in_room (roomId, userId) VALUES (?, ?) RETURNING roomId"
         params = [roomId, userId]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("add_user_to_room", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -220,9 +341,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
 
     def remove_invite_by_toid(self,user_id) -> list[list]:
-        sql = "DELETE FROM invite_list WHERE toId = ? RETURNING * "
         params = [user_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("remove_invite_by_toid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -230,9 +350,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def remove_invite_by_fromid(self,fromid) -> list[list]:
-        sql = "DELETE FROM invite_list WHERE fromId = ? RETURNING * "
         params = [fromid]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("remove_invite_by_fromid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -240,9 +359,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
     
     def get_invite_by_id(self,invite_id) -> list[list] :
-        sql = "SELECT * FROM invite_list WHERE id = ? "
         params = [invite_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_invite_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -250,9 +368,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def remove_invite_by_id(self,invite_id) -> list[list]: 
-        sql = "DELETE FROM invite_list WHERE id = ? RETURNING * "
         params = [invite_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("remove_invite_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -260,12 +377,12 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def get_room_by_id(self, room_id , status = None) -> list[list]:
-        sql = "SELECT * FROM Room WHERE id = ? "
+        query = "get_room_by_id"
         params = [room_id]
         if status is  not None:
-            sql += "AND visibility = ?"
+            query = "get_room_by_id_and_visibility"
             params.append(status)
-        resp = self._send_request(sql, params)
+        resp = self._send_request(query, params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -273,28 +390,12 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
 
     def update_room(self,room_id,name = None ,  hostUserId = None, visibility = None, status = None, gameId = None) ->list[list]:
-        field = []
-        params = []
-        if name is not None:
-            field.append("name = ?")
-            params.append(name)
-        if hostUserId is not None:
-            field.append("hostUserId = ?")
-            params.append(hostUserId)
-        if visibility is not None:
-            field.append("visibility = ?")
-            params.append(visibility)
-        if status is not None:
-            field.append("status = ?")
-            params.append(status)
-        if gameId is not None:
-            field.append("gameId = ?")
-            params.append(gameId)
-        if not field:
+        # None leaves the column as it is (COALESCE on the server)
+        params = [name, hostUserId, visibility, status, gameId]
+        if all(p is None for p in params):
             raise ValueError("No fields provided to update")
-        sql = f"UPDATE Room SET {', '.join(field)} WHERE id = ? RETURNING *"
         params.append(room_id)  
-        resp = self._send_request(sql, params)
+        resp = self._send_request("update_room", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -304,27 +405,13 @@ class DatabaseClient:
     def list_invites(self,user_id):
         """
         Modified to return Room Name, Game ID, and Game Name.
+        Rows have fields roomId, fromId, fromName, id, roomName, gameId, gameName.
         """
-        sql = """
-            SELECT I.roomId, I.fromId, U.name as fromName, I.id, R.name as roomName, R.gameId, G.name as gameName
-            FROM invite_list as I
-            JOIN User as U ON I.fromId = U.id
-            JOIN Room as R ON I.roomId = R.id
-            JOIN Game as G ON R.gameId = G.id
-            WHERE I.toId = ?
-        """
-        params = [user_id]
-        resp = self._send_request(sql, params)
-        if isinstance(resp, dict):
-            if resp.get("status") == "ok":
-                return resp.get("data")
-            else :
-                raise DBclientException(resp.get("error"))
+        return self.query_rows("list_invites", [user_id])
             
     def insert_request(self,roomId:int,requestee_id:int , from_id : int) -> list[list]:
-        sql = "INSERT INTO request_join_list (roomId, fromId, toId) VALUES (?, ?, ?) RETURNING id"
         params = [roomId, from_id, requestee_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("insert_request", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -332,12 +419,12 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def get_request_by_id(self,request_id: int , user_id = None) ->list[list] :
-        sql = "SELECT * FROM request_join_list WHERE id = ? "
+        query = "get_request_by_id"
         params = [request_id]
         if user_id is not None:
-            sql += " AND toId = ?"
+            query = "get_request_by_id_and_toid"
             params.append(user_id)
-        resp = self._send_request(sql, params)
+        resp = self._send_request(query, params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -345,9 +432,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def remove_request_by_userid(self,from_id:int) -> list[list]:
-        sql = "DELETE FROM request_join_list WHERE fromId = ? RETURNING * "
         params = [from_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("remove_request_by_fromid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -355,9 +441,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def remove_request_by_id(self,request_id:int) -> list[list]: 
-        sql = "DELETE FROM request_join_list WHERE id = ? RETURNING * "
         params = [request_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("remove_request_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -365,9 +450,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
     
     def list_requests(self, user_id:int) -> list[list]:
-        sql = "SELECT R.roomId , U.id, U.name , R.id FROM request_join_list AS R , User AS U WHERE R.fromId = U.id AND  toId = ?"
         params = [user_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("list_requests", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -375,9 +459,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def remove_request_by_fromid(self,fromid):
-        sql = "DELETE FROM request_join_list WHERE fromId = ? RETURNING * "
         params = [fromid]
-        resp = self._send_request(sql, params)  
+        resp = self._send_request("remove_request_by_fromid", params)  
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -385,9 +468,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
 
     def remove_request_by_toid(self,toid):
-        sql = "DELETE FROM request_join_list WHERE toId = ? RETURNING * "
         params = [toid]
-        resp = self._send_request(sql, params)  
+        resp = self._send_request("remove_request_by_toid", params)  
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -398,9 +480,8 @@ class DatabaseClient:
         pass
 
     def get_game_by_name(self, game_name: str) -> list[list]:
-        sql = "SELECT * FROM Game WHERE name = ? LIMIT 1"
         params = [game_name]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_game_by_name", params)
         if isinstance(resp, dict): 
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -409,9 +490,8 @@ class DatabaseClient:
         return resp
 
     def insert_game(self, name: str, description: str, ownerId: int, latestVersion: str, min_players: int, max_players: int) -> list[list]:
-        sql = "INSERT INTO Game (name, description, OwnerID, LatestVersion, min_players, max_players) VALUES (?, ?, ?, ?, ?, ?) RETURNING id"
         params = [name, description, ownerId, latestVersion,min_players,max_players]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("insert_game", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -419,9 +499,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def insert_game_version(self, game_id: int, version: str, command: str) -> list[list]:
-        sql = "INSERT INTO GameVersion (gameId, VersionNumber, command) VALUES (?, ?, ?) RETURNING *"
         params = [game_id, version, command]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("insert_game_version", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -434,31 +513,15 @@ class DatabaseClient:
         """
         Dynamically updates Game fields (LatestVersion, description).
         """
-        fields = []
-        params = []
+        # None leaves the column as it is (COALESCE on the server)
+        params = [latest_version, description, min_players, max_players]
 
-        if latest_version is not None:
-            fields.append("LatestVersion = ?")
-            params.append(latest_version)
-        
-        if description is not None:
-            fields.append("description = ?")
-            params.append(description)
-
-        if min_players is not None:
-            fields.append("min_players = ?")
-            params.append(min_players)
-        if max_players is not None:
-            fields.append("max_players = ?")
-            params.append(max_players)
-
-        if not fields:
+        if all(p is None for p in params):
             raise ValueError("No fields provided to update")
 
-        sql = f"UPDATE Game SET {', '.join(fields)} WHERE id = ? RETURNING *"
         params.append(game_id)
 
-        resp = self._send_request(sql, params)
+        resp = self._send_request("update_game", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -466,9 +529,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
             
     def get_version_by_gameid_and_version(self, game_id: int, version: str) -> list[list]:
-        sql = "SELECT * FROM GameVersion WHERE gameId = ? AND VersionNumber = ? LIMIT 1"
         params = [game_id, version]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_version_by_gameid_and_version", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -477,9 +539,8 @@ class DatabaseClient:
         return resp
     
     def delete_game_by_id(self, game_id: int) -> list[list]:
-        sql = "DELETE FROM Game WHERE id = ? RETURNING *"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("delete_game_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -487,9 +548,8 @@ class DatabaseClient:
                 raise DBclientException(resp.get("error"))
     
     def get_all_games_by_ownerid(self, owner_id: int) -> list[list]:
-        sql = "SELECT * FROM Game WHERE OwnerID = ?"
         params = [owner_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_all_games_by_ownerid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -499,9 +559,8 @@ class DatabaseClient:
     
     def delete_game_version_by_id(self, version_id: int) -> list[list]:
         """Deletes a specific version from GameVersion table."""
-        sql = "DELETE FROM GameVersion WHERE id = ? RETURNING *"
         params = [version_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("delete_game_version_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -510,9 +569,8 @@ class DatabaseClient:
         return resp
 
     def get_ordered_versions_by_gameid(self, game_id: int) -> list[list]:
-        sql = "SELECT * FROM GameVersion WHERE gameId = ? ORDER BY UploadDate DESC"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_ordered_versions_by_gameid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -522,9 +580,8 @@ class DatabaseClient:
     
     def delete_all_versions_by_gameid(self, game_id: int) -> list[list]:
         """Deletes all versions associated with a specific game ID."""
-        sql = "DELETE FROM GameVersion WHERE gameId = ? RETURNING *"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("delete_all_versions_by_gameid", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -533,9 +590,8 @@ class DatabaseClient:
         return resp
     
     def get_versions_by_game_id(self, game_id):
-        sql = "SELECT VersionNumber FROM GameVersion WHERE gameId = ?"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_versions_by_game_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -547,8 +603,7 @@ class DatabaseClient:
 
     def list_all_games(self) -> list[list]:
         """Returns a list of all games (id, name)."""
-        sql = "SELECT id, name FROM Game"
-        resp = self._send_request(sql)
+        resp = self._send_request("list_all_games")
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -558,9 +613,8 @@ class DatabaseClient:
 
     def get_game_by_id(self, game_id: int) -> list[list]:
         """Find a game by its ID."""
-        sql = "SELECT * FROM Game WHERE id = ? LIMIT 1"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_game_by_id", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -574,12 +628,8 @@ class DatabaseClient:
         Inserts a review comment for a specific game.
         """
         
-        sql = """
-            INSERT INTO comment (gameId, userId, content, score)
-            VALUES (?, ?, ?, ?) RETURNING *
-        """
         params = [game_id,user_id,content,score]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("insert_comment", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -591,9 +641,8 @@ class DatabaseClient:
         """
         Returns the average score for a game. Returns 0.0 if no reviews exist.
         """
-        sql = "SELECT AVG(score) FROM comment WHERE gameId = ?"
         params = [game_id]
-        resp = self._send_request(sql, params)
+        resp = self._send_request("get_average_score", params)
         if isinstance(resp, dict):
             if resp.get("status") == "ok":
                 return resp.get("data")
@@ -606,21 +655,7 @@ class DatabaseClient:
         """
         Retrieves comments for a game, joining with the User table to get names.
         Returns: [(comment_id, user_name, content, score, timestamp), ...]
+        as rows with fields id, name, content, score, timestamp.
         """
-        
-        sql = """
-            SELECT c.id, u.name, c.content, c.score, c.timestamp 
-            FROM comment c
-            JOIN User u ON c.userId = u.id
-            WHERE c.gameId = ?
-            ORDER BY c.timestamp DESC
-        """
-        params = [game_id]
-        resp = self._send_request(sql, params)
-        if isinstance(resp, dict):
-            if resp.get("status") == "ok":
-                return resp.get("data")
-            else:
-                raise DBclientException(resp.get("error"))
-        return resp
+        return self.query_rows("get_comments_by_game_id", [game_id])
 
@@ -194,6 +194,9 @@ class GameShopServer:
                     if self.server_socket:
                         self.server_socket.close()
                     break
+                elif cmd.split()[:1] == ["stats"]:
+                    # stats [on|off|reset|watch <ms>|unwatch]
+                    print(TCPutils.stats_command(cmd.strip()[len("stats"):]))
             except EOFError:
                 # Handle cases where input stream is closed (e.g., background process)
                 break
@@ -218,6 +221,7 @@ class GameShopServer:
         print(f"[NEW CONN] {addr} connected.")
         session = {"userId": None, "user": None}
         db = DatabaseClient(DB_IP,DB_PORT)
+        TCPutils.require_auth(conn)
         try:
             while self.running: # Check running flag here too
                 metadata, temp_filepath = TCPutils.recv_file(conn, self.temp_dir)
@@ -241,6 +245,8 @@ class GameShopServer:
         except Exception as e:
             print(f"[ERROR] {addr}: {str(e.__traceback__.tb_lineno)}")
         finally:
+            # An upload cut off here resumes from its .part file
+            TCPutils.close_transfers(conn)
             conn.close()
 
     # ==========================================
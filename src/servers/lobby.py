@@ -42,6 +42,8 @@ class MultiThreadedServer:
         self.client_sockets: Dict[Any, socket.socket] = {}
         # user_id -> boolean (True = someone is sending)
         self.sending_flag: Dict[Any, bool] = {}
+        # user_id -> encoded payloads waiting to be flushed in one write
+        self.outbox: Dict[Any, list] = {}
         
         self.lock = threading.Lock()
         self.cond = threading.Condition(self.lock)
@@ -52,7 +54,15 @@ class MultiThreadedServer:
         # Storage paths
         self.storage_dir = "src/servers/uploaded_games"
         self.temp_dir = "src/servers/lobby_tmp"
+        # (owner id, game name) -> (archive path, sha256) of the one archive
+        # kept per game, so it is built and hashed only once per version
+        self.game_archives: Dict[Tuple[Any, str], Tuple[str, str]] = {}
+        self.archive_lock = threading.Lock()
         os.makedirs(self.temp_dir, exist_ok=True)
+        # Archives left by an earlier run are no longer tracked
+        for name in os.listdir(self.temp_dir):
+            if name.startswith("pkg_") and name.endswith(".zip"):
+                os.remove(os.path.join(self.temp_dir, name))
 
     def start(self):
         self.server_socket = create_tcp_passive_socket(self.host, self.port)
@@ -74,6 +84,9 @@ class MultiThreadedServer:
                 self.is_running = False
                 self.server_socket.close()
                 break
+            elif cmd.split()[:1] == ["stats"]:
+                # stats [on|off|reset|watch <ms>|unwatch]
+                print(stats_command(cmd[len("stats"):]))
 
     def _accept_loop(self):
         while self.is_running:
@@ -93,32 +106,45 @@ class MultiThreadedServer:
     # -------------------------------------------------------
     # Async Send Logic
     # -------------------------------------------------------
-    def send_to_client_async(self, user_id, message):
-        t = threading.Thread(target=self._send_worker, args=(user_id, message), daemon=True)
-        t.start()
+    def send_to_client_async(self, user_id, message, reply_to=None):
+        sock = self.client_sockets.get(user_id)
+        if sock is not None:
+            self._enqueue(user_id, encode_message(sock, message, reply_to=reply_to))
+
+    def broadcast_async(self, user_ids, message):
+        # Same message for everyone: encode it once per wire format
+        cache = {}
+        for user_id in user_ids:
+            sock = self.client_sockets.get(user_id)
+            if sock is not None:
+                self._enqueue(user_id, encode_message(sock, message, cache))
 
-    def _send_worker(self, user_id, message):
+    def _enqueue(self, user_id, payload):
         with self.cond:
             if user_id not in self.sending_flag:
                 return
-            while self.sending_flag[user_id]:
+            self.outbox.setdefault(user_id, []).append(payload)
+        t = threading.Thread(target=self._send_worker, args=(user_id,), daemon=True)
+        t.start()
+
+    def _send_worker(self, user_id):
+        with self.cond:
+            while self.sending_flag.get(user_id, False):
                 self.cond.wait()
+            if user_id not in self.sending_flag:
+                return
+            # Take everything queued so far; later workers find an empty outbox
+            pending = self.outbox.pop(user_id, [])
+            if not pending:
+                return
             self.sending_flag[user_id] = True
-
-        with self.lock:
             sock = self.client_sockets.get(user_id)
 
-        if sock is None:
-            with self.cond:
-                if user_id in self.sending_flag:
-                    self.sending_flag[user_id] = False
-                    self.cond.notify_all()
-            return
-
-        try:
-            send_json(sock, message)
-        except Exception as e:
-            pass
+        if sock is not None:
+            try:
+                send_frames(sock, pending)
+            except Exception as e:
+                pass
 
         with self.cond:
             if user_id in self.sending_flag:
@@ -137,6 +163,9 @@ class MultiThreadedServer:
         print(f"[DEBUG] handler started for {user_port}")
         user_id = None
         db = DatabaseClient(self.db_host, self.db_port)
+        require_auth(client_sock)
+        # Client requests are small; a bogus length must not grow this thread
+        set_max_frame_size(client_sock, 1 << 20)
         
         with client_sock:
             while self.is_running:
@@ -151,17 +180,17 @@ class MultiThreadedServer:
 
                 op = msg.get("op")
                 if not op:
-                    self._send_error(client_sock, user_id, "unknown", "Missing 'op' field")
+                    self._send_error(client_sock, user_id, "unknown", "Missing 'op' field", msg.get(RID_FIELD))
                     continue
 
                 handler_info = OP_REGISTRY.get(op)
                 
                 if not handler_info:
-                    self._send_error(client_sock, user_id, op, f"Unknown op '{op}'")
+                    self._send_error(client_sock, user_id, op, f"Unknown op '{op}'", msg.get(RID_FIELD))
                     continue
 
                 if handler_info["auth_required"] and user_id is None:
-                    self._send_error(client_sock, user_id, op, "Login required")
+                    self._send_error(client_sock, user_id, op, "Login required", msg.get(RID_FIELD))
                     continue
 
                 try:
@@ -178,7 +207,8 @@ class MultiThreadedServer:
                     print(f"[Error] Handling op '{op}': {e}")
                     import traceback
                     traceback.print_exc()
-                    self._send_error(client_sock, user_id, op, f"Internal server error: {str(e)}")
+                    self._send_error(client_sock, user_id, op, f"Internal server error: {str(e)}", msg.get(RID_FIELD))
+            close_transfers(client_sock)
 
         # Cleanup
         db.close()
@@ -190,15 +220,16 @@ class MultiThreadedServer:
                     del self.client_sockets[user_id]
                 if user_id in self.sending_flag:
                     del self.sending_flag[user_id]
+                self.outbox.pop(user_id, None)
                 self.cond.notify_all()
         print(f"Client {user_id} disconnected.")
 
-    def _send_error(self, sock, user_id, op, error_msg):
+    def _send_error(self, sock, user_id, op, error_msg, reply_to=None):
         payload = {"status": "error", "op": op, "error": error_msg}
         if user_id is not None:
-            self.send_to_client_async(user_id, payload)
+            self.send_to_client_async(user_id, payload, reply_to)
         else:
-            send_json(sock, payload)
+            send_json(sock, payload, reply_to)
 
     # ==========================================
     # Handlers
@@ -217,24 +248,24 @@ class MultiThreadedServer:
         name = msg.get("name")
         passwordHash = msg.get("passwordHash")
         if not name or not passwordHash:
-            send_json(client_sock, {"status": "error", "op": "register", "error": "Missing fields"})
+            send_json(client_sock, {"status": "error", "op": "register", "error": "Missing fields"}, reply_to=msg.get(RID_FIELD))
             return None, True
 
         try:
             exist = db.find_user_by_name_and_password(name, passwordHash)
             if exist:
-                send_json(client_sock, {"status": "error", "op": "register", "error": "User already exists"})
+                send_json(client_sock, {"status": "error", "op": "register", "error": "User already exists"}, reply_to=msg.get(RID_FIELD))
                 return None, True
             
             db.insert_user(name, passwordHash, 'player')
             get_id = db.find_user_by_name_and_password(name, passwordHash)
             new_id = get_id[0][0]
             
-            send_json(client_sock, {"status": "ok", "op": "register", "id": new_id})
+            send_json(client_sock, {"status": "ok", "op": "register", "id": new_id}, reply_to=msg.get(RID_FIELD))
             self._add_id_socket_mapping(new_id, client_sock)
             return new_id, True
         except Exception as e:
-            send_json(client_sock, {"status": "error", "op": "register", "error": str(e)})
+            send_json(client_sock, {"status": "error", "op": "register", "error": str(e)}, reply_to=msg.get(RID_FIELD))
             return None, True
 
     @handle_op("login", auth_required=False)
@@ -242,23 +273,23 @@ class MultiThreadedServer:
         name = msg.get("name")
         passwordHash = msg.get("passwordHash")
         if not name or not passwordHash:
-            send_json(client_sock, {"status": "error", "op": "login", "error": "Missing fields"})
+            send_json(client_sock, {"status": "error", "op": "login", "error": "Missing fields"}, reply_to=msg.get(RID_FIELD))
             return None, True
 
         try:
             user = db.find_user_by_name_and_password(name, passwordHash)
             if not user or user[0][4] != 'player':
-                send_json(client_sock, {"status": "error", "op": "login", "error": "Invalid credentials"})
+                send_json(client_sock, {"status": "error", "op": "login", "error": "Invalid credentials"}, reply_to=msg.get(RID_FIELD))
                 return None, True
             
             new_id = user[0][0]
             db.update_user(new_id, status="online")
             
             self._add_id_socket_mapping(new_id, client_sock)
-            send_json(client_sock, {"status": "ok", "op": "login", "id": new_id})
+            send_json(client_sock, {"status": "ok", "op": "login", "id": new_id}, reply_to=msg.get(RID_FIELD))
             return new_id, True
         except Exception as e:
-            send_json(client_sock, {"status": "error", "op": "login", "error": str(e)})
+            send_json(client_sock, {"status": "error", "op": "login", "error": str(e)}, reply_to=msg.get(RID_FIELD))
             return None, True
 
     @handle_op("back", auth_required=False)
@@ -266,27 +297,22 @@ class MultiThreadedServer:
         req_id = int(msg.get("userId"))
         if not req_id:
             return None, True
-        send_json(client_sock, {"op": "back", "status": "ok"})
+        send_json(client_sock, {"op": "back", "status": "ok"}, reply_to=msg.get(RID_FIELD))
         self._add_id_socket_mapping(req_id, client_sock)
         return req_id, True
 
     @handle_op("logout", auth_required=True)
     def _logout_user(self, msg, user_id, client_sock, db: DatabaseClient):
         try:
-            in_room = db.check_user_in_room(user_id)
-            if in_room:
-                room_id = db.leave_room(user_id)
-                users_in_room = db.list_user_in_room(room_id[0][0])
-                if not users_in_room:
-                    db.delete_room(room_id[0][0])
-            
-            db.delete_room_by_hostid(user_id)
-            db.remove_invite_by_toid(user_id)
-            db.remove_invite_by_fromid(user_id)
-            db.remove_request_by_fromid(user_id)
-            db.remove_request_by_toid(user_id)
-            
-            db.update_user(user_id, status="offline")
+            # One round trip, one transaction
+            with db.batch() as b:
+                left = b.add("leave_room", [user_id])
+                b.add("delete_room_if_empty", [b.ref(left), b.ref(left)])
+                b.add("remove_invite_by_toid", [user_id])
+                b.add("remove_invite_by_fromid", [user_id])
+                b.add("remove_request_by_fromid", [user_id])
+                b.add("remove_request_by_toid", [user_id])
+                b.add("update_user", [None, None, "offline", user_id])
             return None, False
         except Exception as e:
             print(f"Logout error: {e}")
@@ -295,23 +321,22 @@ class MultiThreadedServer:
     @handle_op("list_rooms", auth_required=True)
     def _list_rooms(self, msg, user_id, client_sock, db: DatabaseClient):
         try:
-            # list_all_rooms now returns [id, name, hostId, visibility, status, gameId, gameName]
-            rooms = db.list_all_rooms()
+            # Paged through a DB server cursor
             room_list = []
-            for room in rooms:
-                if room[3] == "private":
+            for room in db.iter_all_rooms():
+                if room.visibility == "private":
                     continue
                 room_list.append({
-                    "roomId": room[0],
-                    "name": room[1],
-                    "hostId": room[2],
-                    "status": room[4],
-                    "gameId": room[5],
-                    "gameName": room[6]
+                    "roomId": room.id,
+                    "name": room.name,
+                    "hostId": room.hostUserId,
+                    "status": room.status,
+                    "gameId": room.gameId,
+                    "gameName": room.gameName
                 })
-            self.send_to_client_async(user_id, {"status": "ok", "op": "list_rooms", "rooms": room_list})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "list_rooms", "rooms": room_list}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "list_rooms", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "list_rooms", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("list_online_users", auth_required=True)
@@ -320,9 +345,9 @@ class MultiThreadedServer:
             # list_online_users now filters out developers
             users = db.list_online_users()
             users_fmt = [{"id": u[0], "name": u[1]} for u in users]
-            self.send_to_client_async(user_id, {"status": "ok", "op": "list_online_users", "users": users_fmt})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "list_online_users", "users": users_fmt}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "list_online_users", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "list_online_users", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("create_room", auth_required=True)
@@ -331,35 +356,34 @@ class MultiThreadedServer:
         visibility = msg.get("visibility")
         gameId = msg.get("gameId")
         if not name or not visibility or not gameId:
-            self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": "Missing fields"})
+            self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": "Missing fields"}, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         try:
             if db.check_user_in_room(user_id):
-                self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": "Already in room"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": "Already in room"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
 
             room_id = db.create_room(name, user_id, visibility, "idle", gameId)
-            self.send_to_client_async(user_id, {"status": "ok", "op": "create_room", "room_id": room_id[0][0]})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "create_room", "room_id": room_id[0][0]}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "create_room", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("leave_room", auth_required=True)
     def _leave_room(self, msg, user_id, client_sock, db: DatabaseClient):
         try:
-            if not db.check_user_in_room(user_id):
-                self.send_to_client_async(user_id, {"status": "error", "op": "leave_room", "error": "Not in any room"})
+            with db.batch() as b:
+                left = b.add("leave_room", [user_id])
+                b.add("delete_room_if_empty", [b.ref(left), b.ref(left)])
+            room_id = b[left]
+            if not room_id:
+                self.send_to_client_async(user_id, {"status": "error", "op": "leave_room", "error": "Not in any room"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
-
-            room_id = db.leave_room(user_id)
-            users_in_room = db.list_user_in_room(room_id[0][0])
-            if not users_in_room:
-                db.delete_room(room_id[0][0])
             
-            self.send_to_client_async(user_id, {"status": "ok", "op": "leave_room", "message": f"Left room {room_id[0][0]}"})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "leave_room", "message": f"Left room {room_id[0][0]}"}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "leave_room", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "leave_room", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("invite_user", auth_required=True)
@@ -370,18 +394,18 @@ class MultiThreadedServer:
         
         try:
             if not db.find_user_by_id(invitee_id):
-                self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": "Invitee not found"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": "Invitee not found"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
             
             room_id = db.check_user_in_room(user_id)
             if not room_id:
-                self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": "You are not in a room"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": "You are not in a room"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
 
             invite_id = db.add_invite(room_id[0][0], invitee_id, user_id)
             sender = db.find_user_by_id(user_id)
 
-            self.send_to_client_async(user_id, {"status": "ok", "op": "invite_user", "message": "Invited user"})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "invite_user", "message": "Invited user"}, reply_to=msg.get(RID_FIELD))
             self.send_to_client_async(invitee_id, {
                 "status": "ok", 
                 "op": "receive_invite", 
@@ -392,7 +416,7 @@ class MultiThreadedServer:
                 "fromName": sender[0][1]
             })
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "invite_user", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("respond_invite", auth_required=True)
@@ -403,18 +427,19 @@ class MultiThreadedServer:
         try:
             detail = db.get_invite_by_id(invite_id)
             if not detail or detail[0][3] != user_id:
-                self.send_to_client_async(user_id, {"status": "error", "op": "respond_invite", "error": "Invalid invite"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "respond_invite", "error": "Invalid invite"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
 
             room_id = detail[0][1]
             inviter_id = detail[0][2]
 
             if response == "accept":
-                db.remove_invite_by_toid(user_id)
-                db.remove_invite_by_fromid(user_id)
-                db.add_user_to_room(room_id, user_id)
+                with db.batch() as b:
+                    b.add("remove_invite_by_toid", [user_id])
+                    b.add("remove_invite_by_fromid", [user_id])
+                    b.add("add_user_to_room", [room_id, user_id])
                 
-                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_invite", "message": f"Joined room {room_id}" , "room_id": room_id} )
+                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_invite", "message": f"Joined room {room_id}" , "room_id": room_id} , reply_to=msg.get(RID_FIELD))
                 self.send_to_client_async(inviter_id, {
                     "status": "ok", 
                     "op": "invite_accepted", 
@@ -424,7 +449,7 @@ class MultiThreadedServer:
                 })
             elif response == "decline":
                 db.remove_invite_by_id(invite_id)
-                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_invite", "message": "Declined invite"})
+                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_invite", "message": "Declined invite"}, reply_to=msg.get(RID_FIELD))
                 self.send_to_client_async(inviter_id, {
                     "status": "ok", 
                     "op": "invite_declined", 
@@ -433,7 +458,7 @@ class MultiThreadedServer:
                     "from_id": user_id
                 })
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "respond_invite", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "respond_invite", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("list_invite", auth_required=True)
@@ -441,17 +466,17 @@ class MultiThreadedServer:
         try:
             invites = db.list_invites(user_id)
             invite_list = [{
-                "roomId": i[0], 
-                "fromId": i[1], 
-                "fromName": i[2], 
-                "invite_id": i[3],
-                "roomName": i[4],
-                "gameId": i[5],
-                "gameName": i[6]
+                "roomId": i.roomId,
+                "fromId": i.fromId,
+                "fromName": i.fromName,
+                "invite_id": i.id,
+                "roomName": i.roomName,
+                "gameId": i.gameId,
+                "gameName": i.gameName
             } for i in invites]
-            self.send_to_client_async(user_id, {"status": "ok", "op": "list_invite", "invites": invite_list})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "list_invite", "invites": invite_list}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "list_invite", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "list_invite", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("request", auth_required=True)
@@ -460,13 +485,13 @@ class MultiThreadedServer:
         try:
             room = db.get_room_by_id(room_id, "public")
             if not room:
-                self.send_to_client_async(user_id, {"status": "error", "op": "request", "error": "Room not found"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "request", "error": "Room not found"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
             
             roomhost = int(room[0][2])
             req_id = db.insert_request(room_id, roomhost, user_id)
             
-            self.send_to_client_async(user_id, {"status": "ok", "op": "request", "message": "Sending join request"})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "request", "message": "Sending join request"}, reply_to=msg.get(RID_FIELD))
             self.send_to_client_async(roomhost, {
                 "status": "ok", 
                 "op": "receive_request", 
@@ -476,7 +501,7 @@ class MultiThreadedServer:
                 "request_id": req_id[0][0]
             })
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "request", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "request", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("respond_request", auth_required=True)
@@ -486,24 +511,25 @@ class MultiThreadedServer:
         try:
             detail = db.get_request_by_id(req_id, user_id)
             if not detail:
-                self.send_to_client_async(user_id, {"status": "error", "op": "respond_request", "error": "Request not found"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "respond_request", "error": "Request not found"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
 
             room_id = int(detail[0][1])
             requester_id = int(detail[0][2])
 
             if response == "accept":
-                db.remove_request_by_userid(requester_id)
-                db.add_user_to_room(room_id, requester_id)
+                with db.batch() as b:
+                    b.add("remove_request_by_fromid", [requester_id])
+                    b.add("add_user_to_room", [room_id, requester_id])
                 
-                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_request", "respond": "accept", "message": "User added"})
+                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_request", "respond": "accept", "message": "User added"}, reply_to=msg.get(RID_FIELD))
                 self.send_to_client_async(requester_id, {"status": "ok", "op": "request_accepted", "respond": "accept", "message": "Request accepted", "roomId": room_id})
             elif response == "decline":
                 db.remove_request_by_id(req_id)
-                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_request", "respond": "declined", "message": "Declined"})
+                self.send_to_client_async(user_id, {"status": "ok", "op": "respond_request", "respond": "declined", "message": "Declined"}, reply_to=msg.get(RID_FIELD))
                 self.send_to_client_async(requester_id, {"status": "ok", "op": "request_declined", "respond": "declined", "message": "Request declined", "roomId": room_id})
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "respond_request", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "respond_request", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("list_request", auth_required=True)
@@ -511,9 +537,9 @@ class MultiThreadedServer:
         try:
             requests = db.list_requests(user_id)
             req_list = [{"roomId": r[0], "fromId": r[1], "fromName": r[2], "request_id": r[3]} for r in requests]
-            self.send_to_client_async(user_id, {"status": "ok", "op": "list_request", "requests": req_list})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "list_request", "requests": req_list}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "list_request", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "list_request", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("list_games", auth_required=True)
@@ -525,31 +551,31 @@ class MultiThreadedServer:
                 for g in games:
                     game_list.append({"game_id": g[0], "name": g[1]})
             
-            self.send_to_client_async(user_id, {"status": "ok", "op": "list_games", "games": game_list})
+            self.send_to_client_async(user_id, {"status": "ok", "op": "list_games", "games": game_list}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "list_games", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "list_games", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("show_game_data", auth_required=True)
     def _show_game_data(self, msg, user_id, client_sock, db: DatabaseClient):
         target_id = msg.get("game_id")
         if not target_id:
-            self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": "Missing 'game_id'"})
+            self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": "Missing 'game_id'"}, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         try:
             game_data = db.get_game_by_id(target_id)
             if not game_data:
-                self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": "Game not found"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": "Game not found"}, reply_to=msg.get(RID_FIELD))
             else:
                 row = game_data[0]
                 response_data = {
                     "id": row[0], "name": row[1], "description": row[2], 
                     "owner_id": row[3], "latest_version": row[4] , "min_players": row[5], "max_players": row[6]
                 }
-                self.send_to_client_async(user_id, {"status": "ok", "op": "show_game_data", "data": response_data})
+                self.send_to_client_async(user_id, {"status": "ok", "op": "show_game_data", "data": response_data}, reply_to=msg.get(RID_FIELD))
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "show_game_data", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         return user_id, True
 
     @handle_op("show_comment", auth_required=True)
@@ -560,7 +586,7 @@ class MultiThreadedServer:
                 "status": "error", 
                 "op": "show_comment", 
                 "error": "Missing 'game_id'"
-            })
+            }, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         try:
@@ -570,11 +596,11 @@ class MultiThreadedServer:
             if comments:
                 for c in comments:
                     comment_list.append({
-                        "comment_id": c[0], 
-                        "user_name": c[1], # Now guaranteed to be the name
-                        "content": c[2], 
-                        "score": c[3], 
-                        "timestamp": c[4]
+                        "comment_id": c.id,
+                        "user_name": c.name, # Now guaranteed to be the name
+                        "content": c.content,
+                        "score": c.score,
+                        "timestamp": c.timestamp
                     })
             
             # 2. Get Average Score (NEW)
@@ -586,113 +612,137 @@ class MultiThreadedServer:
                 "op": "show_comment", 
                 "comments": comment_list,
                 "average_score": round(avg_score[0][0], 1) # Rounded for cleaner UI
-            })
+            }, reply_to=msg.get(RID_FIELD))
 
         except Exception as e:
             self.send_to_client_async(user_id, {
                 "status": "error", 
                 "op": "show_comment", 
                 "error": str(e)
-            })
+            }, reply_to=msg.get(RID_FIELD))
         
         return user_id, True
     @handle_op("download_game", auth_required=True)
     def _download_game(self, msg, user_id, client_sock, db: DatabaseClient):
         game_name = msg.get("game_name")
         if not game_name:
-            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Missing game_name"})
+            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Missing game_name"}, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         try:
             game_rows = db.get_game_by_name(game_name)
             if not game_rows:
-                self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Game not found"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Game not found"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
             
             owner_id = game_rows[0][3]
             latest_version = game_rows[0][4]
         except Exception as e:
-            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": f"DB Error: {e}"})
+            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": f"DB Error: {e}"}, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         source_path = get_game_location(self.storage_dir, owner_id, game_name, latest_version)
         if not os.path.exists(source_path):
-             self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Game files missing on server"})
+             self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": "Game files missing on server"}, reply_to=msg.get(RID_FIELD))
              return user_id, True
 
-        # 3. Staging for Zip
+        # 3. Reuse the archive built for this exact version, so a client
+        #    retrying an interrupted download resumes the same transfer.
+        stamp = os.stat(source_path).st_mtime_ns
+        archive_path = os.path.join(self.temp_dir, f"pkg_{owner_id}_{game_name}_{latest_version}_{stamp}.zip")
         staging_dir = os.path.join(self.temp_dir, f"stage_{user_id}_{game_name}")
-        if os.path.exists(staging_dir):
-            shutil.rmtree(staging_dir)
-        os.makedirs(staging_dir)
 
         try:
-            # --- COPY CLIENT FOLDER ---
-            client_src = os.path.join(source_path, "client")
-            if os.path.exists(client_src):
-                shutil.copytree(client_src, os.path.join(staging_dir, "client"))
-            
-            # --- COPY CONFIG ---
-            config_src = os.path.join(source_path, "config.json")
-            if os.path.exists(config_src):
-                shutil.copy(config_src, staging_dir)
-
-            # --- NEW: COPY DEPENDENCY FILES ---
-            # These are required for 'uv run' to work on the client side
-            toml_src = os.path.join(source_path, "pyproject.toml")
-            if os.path.exists(toml_src):
-                shutil.copy(toml_src, staging_dir)
-            
-            lock_src = os.path.join(source_path, "uv.lock")
-            if os.path.exists(lock_src):
-                shutil.copy(lock_src, staging_dir)
-            # ----------------------------------
-
-            # 4. Zip it
-            zip_base_name = os.path.join(self.temp_dir, f"pkg_{user_id}_{game_name}")
-            archive_path = shutil.make_archive(zip_base_name, 'zip', staging_dir)
-            
-            # 5. Send File (Thread-safe)
-            with self.cond:
-                while self.sending_flag.get(user_id, False):
-                    self.cond.wait()
-                self.sending_flag[user_id] = True
+            digest = self._game_archive((owner_id, game_name), source_path, staging_dir, archive_path, user_id)
 
+            # 5. Send File. No sending_flag here: send_file serialises its own
+            #    writes, and on a multiplexed connection the notifications
+            #    queued for this user go out between the file's data frames.
             try:
                 metadata = {
                     "status": "ok",
                     "op": "download_game",
                     "game_name": game_name,
-                    "version": latest_version
+                    "version": latest_version,
+                    "sha256": digest
                 }
                 # Using your existing send_file utility
-                send_file(client_sock, archive_path, metadata)
+                send_file(client_sock, archive_path, metadata, reply_to=msg.get(RID_FIELD))
             except Exception as e:
                 print(f"Error sending file: {e}")
-            finally:
-                with self.cond:
-                    self.sending_flag[user_id] = False
-                    self.cond.notify_all()
 
         except Exception as e:
             print(f"Error zipping/staging: {e}")
-            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "download_game", "error": str(e)}, reply_to=msg.get(RID_FIELD))
         finally:
             # 6. Cleanup
             if os.path.exists(staging_dir):
                 shutil.rmtree(staging_dir)
-            if 'archive_path' in locals() and os.path.exists(archive_path):
-                os.remove(archive_path)
 
         return user_id, True
 
+    def _game_archive(self, key, source_path, staging_dir, archive_path, user_id):
+        """
+        sha256 of the game's archive at archive_path, building it first if
+        needed. Only the newest archive of each game is kept: the one it
+        replaces (older version or older files) is deleted.
+        """
+        with self.archive_lock:
+            cached = self.game_archives.get(key)
+        if cached is not None and cached[0] == archive_path and os.path.exists(archive_path):
+            return cached[1]
+        if not os.path.exists(archive_path):
+            self._build_game_archive(source_path, staging_dir, archive_path, user_id)
+        digest = file_sha256(archive_path)
+        with self.archive_lock:
+            previous = self.game_archives.get(key)
+            self.game_archives[key] = (archive_path, digest)
+        if previous is not None and previous[0] != archive_path:
+            try:
+                os.remove(previous[0])
+            except FileNotFoundError:
+                pass
+        return digest
+
+    def _build_game_archive(self, source_path, staging_dir, archive_path, user_id):
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        os.makedirs(staging_dir)
+
+        # --- COPY CLIENT FOLDER ---
+        client_src = os.path.join(source_path, "client")
+        if os.path.exists(client_src):
+            shutil.copytree(client_src, os.path.join(staging_dir, "client"))
+
+        # --- COPY CONFIG ---
+        config_src = os.path.join(source_path, "config.json")
+        if os.path.exists(config_src):
+            shutil.copy(config_src, staging_dir)
+
+        # --- NEW: COPY DEPENDENCY FILES ---
+        # These are required for 'uv run' to work on the client side
+        toml_src = os.path.join(source_path, "pyproject.toml")
+        if os.path.exists(toml_src):
+            shutil.copy(toml_src, staging_dir)
+
+        lock_src = os.path.join(source_path, "uv.lock")
+        if os.path.exists(lock_src):
+            shutil.copy(lock_src, staging_dir)
+        # ----------------------------------
+
+        # 4. Zip it under a per-user name, then move it into place so
+        #    concurrent downloads never see a half-written archive.
+        zip_base_name = os.path.join(self.temp_dir, f"pkg_{user_id}_{os.path.basename(archive_path)}")
+        built = shutil.make_archive(zip_base_name, 'zip', staging_dir)
+        os.replace(built, archive_path)
+
     @handle_op("start", auth_required=True)
     def _start_game(self, msg, user_id, client_sock, db: DatabaseClient):
         print(f"[DEBUG] received start op from user {user_id}")
         try:
             room_data = db.check_user_in_room(user_id)
             if not room_data:
-                self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": "Not in room"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": "Not in room"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
             
             roomId = room_data[0][0]
@@ -708,7 +758,7 @@ class MultiThreadedServer:
             max_players = game[0][6]
 
             if len(room_users) < min_players or len(room_users) > max_players:
-                self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": "Player count not in allowed range"})
+                self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": "Player count not in allowed range"}, reply_to=msg.get(RID_FIELD))
                 return user_id, True
             
             gamefolder = get_game_location(self.storage_dir,ownerid,game_name,LatestVersion)
@@ -744,14 +794,17 @@ class MultiThreadedServer:
 
             db.update_room(roomId, status="playing")
 
-            for user in room_users:
-                self.send_to_client_async(user[0], {
-                    "status": "ok", 
-                    "op": "start", 
-                    "game_server_ip": self.host, 
-                    "game_server_port": game_port,
-                    "game_name":game_name
-                })
+            start_msg = {
+                "status": "ok", 
+                "op": "start", 
+                "game_server_ip": self.host, 
+                "game_server_port": game_port,
+                "game_name":game_name
+            }
+            # The starter's copy is the reply to its request; the others
+            # share one encoding
+            self.broadcast_async([uid for uid in room_user_ids if uid != user_id], start_msg)
+            self.send_to_client_async(user_id, start_msg, reply_to=msg.get(RID_FIELD))
 
             monitor_thread = threading.Thread(
                 target=self._gameserver_monitor, 
@@ -765,7 +818,7 @@ class MultiThreadedServer:
             
         except Exception as e:
             print(f"Start game error: {e}")
-            self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": str(e)})
+            self.send_to_client_async(user_id, {"status": "error", "op": "start", "error": str(e)}, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
     def _gameserver_monitor(self, process: subprocess.Popen, room_id):
@@ -832,7 +885,7 @@ class MultiThreadedServer:
                 "status": "error", 
                 "op": "add_comment", 
                 "error": "Missing game_id, content, or score"
-            })
+            }, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         # 2. Score Validation (Must be 1-5 based on DB constraints)
@@ -845,7 +898,7 @@ class MultiThreadedServer:
                 "status": "error", 
                 "op": "add_comment", 
                 "error": "Score must be an integer between 1 and 5"
-            })
+            }, reply_to=msg.get(RID_FIELD))
             return user_id, True
 
         try:
@@ -856,14 +909,14 @@ class MultiThreadedServer:
                 "status": "ok", 
                 "op": "add_comment", 
                 "message": "Comment added successfully"
-            })
+            }, reply_to=msg.get(RID_FIELD))
             
         except Exception as e:
             self.send_to_client_async(user_id, {
                 "status": "error", 
                 "op": "add_comment", 
                 "error": str(e)
-            })
+            }, reply_to=msg.get(RID_FIELD))
 
         return user_id, True
 
@@ -0,0 +1,8 @@
+"""Every named lookup in queries.py is served by an index."""
+from DBinit import find_full_scans, migrate
+
+
+def test_named_queries_use_indexes(tmp_path):
+    db_path = str(tmp_path / "database.db")
+    migrate(db_path)
+    assert find_full_scans(db_path) == []
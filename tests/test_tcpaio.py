@@ -0,0 +1,41 @@
+"""TCPaio clients against servers that use the blocking TCPutils."""
+import asyncio
+import hashlib
+import os
+import threading
+
+from utils import TCPaio, TCPutils
+
+
+def test_download_from_blocking_server(tmp_path):
+    payload = os.urandom(3 << 20)
+    source = tmp_path / "game.zip"
+    source.write_bytes(payload)
+    listener = TCPutils.create_tcp_passive_socket("127.0.0.1", 0)
+    port = listener.getsockname()[1]
+
+    def serve():
+        conn, _ = listener.accept()
+        # recv_json answers the hello, then the client asks for the file
+        request = TCPutils.recv_json(conn, 5)
+        TCPutils.send_file(conn, str(source), {"op": request["op"]})
+        conn.close()
+
+    server = threading.Thread(target=serve)
+    server.start()
+
+    async def download():
+        stream = await TCPaio.open_connection("127.0.0.1", port)
+        await TCPaio.handshake(stream)
+        assert not stream.resumable and not stream.multiplexed
+        await TCPaio.send_json(stream, {"op": "download"})
+        result = await TCPaio.recv_file(stream, str(tmp_path / "out"), 5)
+        await stream.close()
+        return result
+
+    metadata, saved = asyncio.run(download())
+    server.join()
+    listener.close()
+    assert metadata["op"] == "download"
+    with open(saved, "rb") as f:
+        assert hashlib.sha256(f.read()).digest() == hashlib.sha256(payload).digest()
@@ -0,0 +1,41 @@
+"""Wire behaviour of the blocking TCPutils helpers."""
+import socket
+
+import pytest
+
+from utils import TCPutils
+
+
+@pytest.mark.parametrize("stats", [False, True])
+def test_send_json_many_answers_the_request(stats):
+    TCPutils.enable_stats(stats)
+    client, server = socket.socketpair()
+    try:
+        TCPutils.send_json(client, {"op": "ping", TCPutils.RID_FIELD: 7})
+        request = TCPutils.recv_json(server, 5)
+        assert request["op"] == "ping"
+        TCPutils.send_json_many(server, [{"op": "pong"}, {"op": "note"}],
+                                reply_to=request[TCPutils.RID_FIELD])
+        first, second = TCPutils.recv_json(client, 5), TCPutils.recv_json(client, 5)
+        assert first[TCPutils.REPLY_FIELD] == 7
+        assert TCPutils.REPLY_FIELD not in second
+    finally:
+        TCPutils.enable_stats(False)
+        client.close()
+        server.close()
+
+
+def test_replies_are_tagged_only_when_asked():
+    client, server = socket.socketpair()
+    try:
+        TCPutils.send_json(client, {"op": "ping", TCPutils.RID_FIELD: 3})
+        TCPutils.recv_json(server, 5)
+        # Receiving a request leaves no state behind for the next send
+        TCPutils.send_json(server, {"op": "note"})
+        TCPutils.send_json(server, {"op": "pong"}, reply_to=3)
+        note, pong = TCPutils.recv_json(client, 5), TCPutils.recv_json(client, 5)
+        assert TCPutils.REPLY_FIELD not in note
+        assert pong[TCPutils.REPLY_FIELD] == 3
+    finally:
+        client.close()
+        server.close()
@@ -0,0 +1,220 @@
+"""
+asyncio versions of the TCPutils helpers.
+
+The wire format is exactly the one of utils.TCPutils (same framing, token
+attachment, handshake and file header), so a server can move to an event
+loop while its peers keep using blocking sockets.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Tuple, Iterable
+
+from utils.TCPutils import (
+    Codec, Compressor, ConnectionClosedByPeer, FrameTooLarge, DEFAULT_CODEC, COMPRESS_THRESHOLD,
+    FILE_CHUNK_SIZE, HELLO_OP, MAX_FRAME_SIZE, REPLY_FIELD, encode_json,
+    _FLAGGED_HEADER, _LENGTH_PREFIX, _add_file_header, _apply_hello, _authenticate, _check_digest,
+    _frame_buffers, _hello_reply, _hello_request, _inflate, _is_hello_request,
+)
+
+
+class Stream:
+    """
+    A reader/writer pair plus the protocol state of the connection
+    (the asyncio counterpart of a socket and its TCPutils.Session).
+    """
+    # File transfers stay one-shot here; the hello never grants resume
+    # (and so never multiplexed streams either).
+    can_resume = False
+    can_multiplex = False
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.codec: Codec = DEFAULT_CODEC
+        self.preferred_codecs: Tuple[str, ...] | None = None
+        self.compression: Compressor | None = None
+        self.compress_threshold = COMPRESS_THRESHOLD
+        self.flagged = False
+        self.resumable = False
+        self.multiplexed = False
+        self.send_token = True
+        self.auth_required = False
+        self.authenticated = False
+        self.max_frame_size = MAX_FRAME_SIZE
+        # Header of a frame whose body timed out, so the next call resumes it.
+        self._pending: Tuple[int, int] | None = None
+
+    def use_flagged_framing(self) -> None:
+        self.flagged = True
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def open_connection(host: str, port: int) -> Stream:
+    """Async counterpart of create_tcp_socket()."""
+    reader, writer = await asyncio.open_connection(host, port)
+    return Stream(reader, writer)
+
+
+def set_preferred_codecs(stream: Stream, codecs: Iterable[str]) -> None:
+    """Server side: codecs to pick from when a client says hello, best first."""
+    stream.preferred_codecs = tuple(codecs)
+
+
+def set_max_frame_size(stream: Stream, size: int) -> None:
+    """Same contract as TCPutils.set_max_frame_size()."""
+    stream.max_frame_size = size
+
+
+def require_auth(stream: Stream) -> None:
+    """Server side: same contract as TCPutils.require_auth()."""
+    stream.auth_required = True
+
+
+async def send_frames(stream: Stream, payloads: list[bytes]) -> None:
+    buffers = []
+    for payload in payloads:
+        _frame_buffers(stream, payload, buffers)
+    stream.writer.writelines(buffers)
+    await stream.writer.drain()
+
+
+async def send_json(stream: Stream, obj: dict, reply_to: Any = None) -> None:
+    """
+    Send a dictionary using Length-Prefixed Framing Protocol.
+    Pass the request's RID_FIELD as `reply_to` when this is its reply.
+    """
+    if reply_to is not None:
+        obj = {**obj, REPLY_FIELD: reply_to}
+    await send_frames(stream, [encode_json(obj, stream.codec, stream.send_token)])
+
+
+async def send_json_many(stream: Stream, objs: list[dict], reply_to: Any = None) -> None:
+    if reply_to is not None and objs:
+        objs = [{**objs[0], REPLY_FIELD: reply_to}, *objs[1:]]
+    await send_frames(stream, [encode_json(obj, stream.codec, stream.send_token) for obj in objs])
+
+
+async def _read_frame(stream: Stream, timeout: float | None) -> memoryview | None:
+    reader = stream.reader
+    try:
+        if stream._pending is None:
+            header = _FLAGGED_HEADER if stream.flagged else _LENGTH_PREFIX
+            raw = await asyncio.wait_for(reader.readexactly(header.size), timeout)
+            fields = header.unpack(raw)
+            if fields[0] > stream.max_frame_size:
+                raise FrameTooLarge(f"Frame of {fields[0]} bytes exceeds {stream.max_frame_size}")
+            stream._pending = (fields[0], fields[1] if stream.flagged else 0)
+        msg_len, flags = stream._pending
+        # readexactly() consumes nothing when it is cancelled, so a timeout
+        # here leaves the body in the buffer for the next call.
+        data = await asyncio.wait_for(reader.readexactly(msg_len), timeout)
+    except (TimeoutError, asyncio.TimeoutError):
+        return None
+    except asyncio.IncompleteReadError:
+        raise ConnectionClosedByPeer()
+    stream._pending = None
+    return _inflate(memoryview(data), flags, stream.max_frame_size)
+
+
+async def recv_json(stream: Stream, timeout: float | None = None) -> dict | None:
+    """
+    Receive a dictionary using length-prefixed framing.
+    Returns None if timeout or invalid payload.
+    Raises ConnectionClosedByPeer if the connection is closed by peer.
+    Handshake requests are answered here and never reach the caller.
+    """
+    while True:
+        frame = await _read_frame(stream, timeout)
+        if frame is None:
+            return None
+        try:
+            with frame:
+                result = stream.codec.decode(frame)
+        except Exception:
+            result = None
+        if stream.auth_required and not stream.authenticated:
+            _authenticate(stream, result)
+        if result is None:
+            return None
+        if _is_hello_request(result):
+            reply = _hello_reply(stream, result)
+            await send_json(stream, reply)
+            _apply_hello(stream, reply)
+            continue
+        return result
+
+
+async def handshake(stream: Stream, codecs: Iterable[str] = ("binary", "json"),
+                    compression: Iterable[str] = ("zstd", "zlib"), timeout: float | None = 5.0) -> str:
+    """
+    Client side: same negotiation as TCPutils.handshake().
+    Returns the codec name in use.
+    """
+    # Stream can't do resumable or multiplexed files: don't ask for them
+    await send_json(stream, _hello_request(codecs, compression, resume=False, streams=False))
+    reply = await recv_json(stream, timeout)
+    if reply is not None and reply.get("op") == HELLO_OP:
+        _apply_hello(stream, reply)
+    return stream.codec.name
+
+
+async def send_file(stream: Stream, file_path: str, data: dict, reply_to: Any = None) -> None:
+    """
+    Send a file + metadata.
+    Protocol: [Length-Prefixed JSON Header (with filesize)] + [Raw File Bytes]
+    """
+    # Hashing reads the whole file; keep it off the event loop.
+    await asyncio.to_thread(_add_file_header, file_path, data)
+    await send_json(stream, data, reply_to)
+
+    loop = asyncio.get_running_loop()
+    with open(file_path, "rb") as f:
+        # Transport-level sendfile: flushes the buffered header first, then
+        # uses os.sendfile() on the underlying socket when it can.
+        await loop.sendfile(stream.writer.transport, f)
+
+
+async def recv_file(stream: Stream, save_dir: str, timeout: float | None = None) -> Tuple[dict | None, str | None]:
+    """
+    Receive a JSON header followed by a binary file.
+    Returns: (metadata_dict, saved_file_path)
+    """
+    metadata = await recv_json(stream, timeout)
+    if metadata is None:
+        return None, None
+
+    filesize = metadata.get("filesize")
+    filename = metadata.get("filename")
+    if filesize is None or filename is None:
+        return metadata, None
+
+    os.makedirs(save_dir, exist_ok=True)
+    file_path = os.path.join(save_dir, filename)
+    remaining = filesize
+    hasher = hashlib.sha256()
+
+    try:
+        with open(file_path, "wb") as f:
+            while remaining > 0:
+                chunk = await asyncio.wait_for(stream.reader.read(min(remaining, FILE_CHUNK_SIZE)), timeout)
+                if not chunk:
+                    raise ConnectionClosedByPeer("Socket closed during file transfer")
+                hasher.update(chunk)
+                f.write(chunk)
+                remaining -= len(chunk)
+        _check_digest(metadata, hasher)
+    except (TimeoutError, asyncio.TimeoutError):
+        return None, None
+    except Exception as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise e
+
+    return metadata, file_path
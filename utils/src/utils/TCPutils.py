@@ -2,8 +2,18 @@ import socket
 import struct
 import os
 from dotenv import load_dotenv
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Any, Dict, Iterable
 import json
+import threading
+import weakref
+import zlib
+import hashlib
+import hmac
+import itertools
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
 
 load_dotenv()
 token=os.getenv("TOKEN") 
@@ -29,63 +39,1226 @@ def create_tcp_socket(host : str, port: int ) -> socket.socket:
     return s
 
 
-def send_json(sock: socket.socket, obj: dict) -> None:
+# ==========================================
+# Codecs
+# ==========================================
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Codec(ABC):
+    """
+    Turns message objects into frame payloads and back.
+    Register new ones with register_codec() to make them negotiable.
+    """
+    name = ""
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data: memoryview) -> Any:
+        ...
+
+
+class JsonCodec(Codec):
+    """UTF-8 JSON, through orjson when it is installed."""
+    name = "json"
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass  # e.g. ints above 64 bits, let the stdlib handle it
+        return json.dumps(obj).encode("utf-8")
+
+    def decode(self, data: memoryview) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        # str() decodes straight out of the receive buffer.
+        return json.loads(str(data, "utf-8"))
+
+
+# Binary codec tags. 0x00-0x7f is a small non-negative int stored in the tag.
+_T_NONE = 0x80
+_T_FALSE = 0x81
+_T_TRUE = 0x82
+_T_INT = 0x83    # zigzag varint
+_T_FLOAT = 0x84  # 8-byte IEEE 754
+_T_STR = 0x85    # varint length + UTF-8
+_T_BYTES = 0x86  # varint length + raw bytes
+_T_LIST = 0x87   # varint count + items
+_T_MAP = 0x88    # varint count + key/value pairs
+_DOUBLE = struct.Struct("!d")
+
+
+class BinaryCodec(Codec):
+    """
+    Compact tagged encoding of None/bool/int/float/str/bytes/list/map.
+    Result sets shrink because rows carry no brackets, quotes or commas.
+    """
+    name = "binary"
+
+    def encode(self, obj: Any) -> bytes:
+        out = bytearray()
+        self._encode(obj, out)
+        return bytes(out)
+
+    def _encode(self, obj: Any, out: bytearray) -> None:
+        if obj is None:
+            out.append(_T_NONE)
+        elif obj is True:
+            out.append(_T_TRUE)
+        elif obj is False:
+            out.append(_T_FALSE)
+        elif isinstance(obj, int):
+            if 0 <= obj < 0x80:
+                out.append(obj)
+            else:
+                out.append(_T_INT)
+                _put_varint(out, (obj << 1) if obj >= 0 else ((-obj << 1) - 1))
+        elif isinstance(obj, str):
+            data = obj.encode("utf-8")
+            out.append(_T_STR)
+            _put_varint(out, len(data))
+            out += data
+        elif isinstance(obj, (list, tuple)):
+            out.append(_T_LIST)
+            _put_varint(out, len(obj))
+            for item in obj:
+                self._encode(item, out)
+        elif isinstance(obj, dict):
+            out.append(_T_MAP)
+            _put_varint(out, len(obj))
+            for key, value in obj.items():
+                self._encode(key, out)
+                self._encode(value, out)
+        elif isinstance(obj, float):
+            out.append(_T_FLOAT)
+            out += _DOUBLE.pack(obj)
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            out.append(_T_BYTES)
+            _put_varint(out, len(obj))
+            out += obj
+        else:
+            raise TypeError(f"Cannot encode {type(obj).__name__}")
+
+    def decode(self, data: memoryview) -> Any:
+        obj, pos = self._decode(data, 0)
+        if pos != len(data):
+            raise ValueError("Trailing bytes after binary payload")
+        return obj
+
+    def _decode(self, data: memoryview, pos: int) -> Tuple[Any, int]:
+        tag = data[pos]
+        pos += 1
+        if tag < 0x80:
+            return tag, pos
+        if tag == _T_STR:
+            size, pos = _get_varint(data, pos)
+            return str(data[pos:pos + size], "utf-8"), pos + size
+        if tag == _T_LIST:
+            count, pos = _get_varint(data, pos)
+            items = []
+            for _ in range(count):
+                item, pos = self._decode(data, pos)
+                items.append(item)
+            return items, pos
+        if tag == _T_INT:
+            raw, pos = _get_varint(data, pos)
+            return (-((raw + 1) >> 1) if raw & 1 else raw >> 1), pos
+        if tag == _T_MAP:
+            count, pos = _get_varint(data, pos)
+            result = {}
+            for _ in range(count):
+                key, pos = self._decode(data, pos)
+                result[key], pos = self._decode(data, pos)
+            return result, pos
+        if tag == _T_NONE:
+            return None, pos
+        if tag == _T_TRUE:
+            return True, pos
+        if tag == _T_FALSE:
+            return False, pos
+        if tag == _T_FLOAT:
+            return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+        if tag == _T_BYTES:
+            size, pos = _get_varint(data, pos)
+            return bytes(data[pos:pos + size]), pos + size
+        raise ValueError(f"Unknown binary tag {tag:#x}")
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data: memoryview, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Make a codec available for negotiation under codec.name."""
+    CODECS[codec.name] = codec
+
+
+register_codec(JsonCodec())
+register_codec(BinaryCodec())
+
+DEFAULT_CODEC = CODECS["json"]
+
+
+# ==========================================
+# Framing
+# ==========================================
+
+_LENGTH_PREFIX = struct.Struct("!I")
+# After a handshake both peers switch to length + flags.
+_FLAGGED_HEADER = struct.Struct("!IB")
+
+FLAG_ZLIB = 0x01
+FLAG_ZSTD = 0x02
+_COMPRESSION_FLAGS = FLAG_ZLIB | FLAG_ZSTD
+# Raw file bytes of a multiplexed transfer: [stream id] + [bytes].
+FLAG_DATA = 0x04
+_STREAM_ID = struct.Struct("!I")
+
+# Frames at or below this many payload bytes are never compressed.
+COMPRESS_THRESHOLD = 2048
+# Largest frame payload (after decompression) a reader accepts by default.
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+
+class Compressor:
+    """decompress(data, max_length) returns at most max_length bytes."""
+
+    def __init__(self, name: str, flag: int, compress, decompress):
+        self.name = name
+        self.flag = flag
+        self.compress = compress
+        self.decompress = decompress
+
+
+COMPRESSORS: Dict[str, Compressor] = {
+    "zlib": Compressor("zlib", FLAG_ZLIB, lambda data: zlib.compress(data, 1),
+                       lambda data, max_length: zlib.decompressobj().decompress(data, max_length)),
+}
+if zstd is not None:
+    COMPRESSORS["zstd"] = Compressor("zstd", FLAG_ZSTD, zstd.compress,
+                                     lambda data, max_length: zstd.ZstdDecompressor().decompress(data, max_length))
+_DECOMPRESSORS = {c.flag: c.decompress for c in COMPRESSORS.values()}
+
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+
+
+def encode_json(obj: dict, codec: Codec = DEFAULT_CODEC, with_token: bool = True) -> bytes:
+    """
+    Encode a dictionary into a frame payload.
+    Peers without an authenticated session need the token on every message;
+    it goes on a copy, `obj` itself is never modified.
+    Encode once and reuse the bytes when the same message goes to many sockets.
+    """
+    if with_token:
+        obj = {**obj, "token": token}
+    return codec.encode(obj)
+
+
+def encode_message(sock: socket.socket, obj: dict, cache: dict | None = None, reply_to: Any = None) -> bytes:
+    """
+    Encode a dictionary the way this socket's peer expects it.
+    Pass the same `cache` dict while broadcasting to encode once per wire format.
+    `reply_to` is the RID_FIELD of the request this message answers; a
+    reply is for one peer only, so it is never cached.
+    """
+    session = get_session(sock)
+    codec, with_token = session.codec, session.send_token
+    instrumented = _stats_enabled
+    if instrumented:
+        started = time.perf_counter_ns()
+    if reply_to is not None:
+        obj = {**obj, REPLY_FIELD: reply_to}
+        payload = encode_json(obj, codec, with_token)
+    elif cache is None:
+        payload = encode_json(obj, codec, with_token)
+    else:
+        key = (codec.name, with_token)
+        payload = cache.get(key)
+        if payload is None:
+            payload = cache[key] = encode_json(obj, codec, with_token)
+    if instrumented:
+        _record(session, "encode", obj.get("op"), len(payload), time.perf_counter_ns() - started)
+    return payload
+
+
+def _sendmsg_all(sock: socket.socket, buffers: list) -> None:
+    """
+    Scatter-gather send of every buffer, resuming after partial writes.
+    Buffers are never joined, so payloads are not copied in userspace.
+    """
+    views = [memoryview(b) for b in buffers if len(b)]
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i + _IOV_MAX])
+        # Skip the buffers the kernel took completely, trim the partial one.
+        while sent:
+            size = views[i].nbytes
+            if sent >= size:
+                sent -= size
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
+
+
+def _write_buffers(sock: socket.socket, buffers: list) -> None:
+    if hasattr(sock, "sendmsg"):
+        _sendmsg_all(sock, buffers)
+    else:
+        # No sendmsg() on Windows
+        sock.sendall(b"".join(buffers))
+
+
+def _frame_buffers(session: "Session", payload: bytes, buffers: list) -> None:
+    """Append header and body of one frame, compressing it if negotiated."""
+    if not session.flagged:
+        buffers.append(_LENGTH_PREFIX.pack(len(payload)))
+        buffers.append(payload)
+        return
+    flags = 0
+    compressor = session.compression
+    if compressor is not None and len(payload) > session.compress_threshold:
+        packed = compressor.compress(payload)
+        if len(packed) < len(payload):
+            payload = packed
+            flags |= compressor.flag
+    buffers.append(_FLAGGED_HEADER.pack(len(payload), flags))
+    buffers.append(payload)
+
+
+def send_frames(sock: socket.socket, payloads: list[bytes]) -> None:
+    """
+    Send already encoded payloads as consecutive length-prefixed frames
+    with as few syscalls as possible.
+    """
+    session = get_session(sock)
+    buffers = []
+    for payload in payloads:
+        _frame_buffers(session, payload, buffers)
+    instrumented = _stats_enabled
+    if instrumented:
+        started = time.perf_counter_ns()
+    # Frames from concurrent senders never interleave mid-frame.
+    with session.write_lock:
+        _write_buffers(sock, buffers)
+    if instrumented:
+        # Blocked time includes waiting for the write lock.
+        _record(session, "send", None, sum(len(b) for b in buffers),
+                time.perf_counter_ns() - started, len(payloads))
+
+
+def send_json(sock: socket.socket, obj: dict, reply_to: Any = None) -> None:
     """
     Send a dictionary as JSON using Length-Prefixed Framing Protocol.
+    Pass the request's RID_FIELD as `reply_to` when this is its reply.
     """
-    obj["token"] = token
+    send_frames(sock, [encode_message(sock, obj, reply_to=reply_to)])
 
-    data = json.dumps(obj).encode("utf-8")
-    length_prefix = struct.pack("!I", len(data))
-    sock.sendall(length_prefix + data)
+
+def send_json_many(sock: socket.socket, objs: list[dict], reply_to: Any = None) -> None:
+    """
+    Send several dictionaries back-to-back in one scatter-gather write.
+    With `reply_to`, the first one is the reply to that request.
+    """
+    send_frames(sock, [encode_message(sock, obj, reply_to=reply_to if i == 0 else None)
+                       for i, obj in enumerate(objs)])
 
 
 class ConnectionClosedByPeer(Exception):
     pass
 
+
+class FrameTooLarge(ConnectionClosedByPeer):
+    """
+    A frame header announced more than the reader's max_frame_size. The
+    rest of the stream cannot be trusted, so this ends the connection.
+    """
+
+
+class AuthenticationFailed(ConnectionClosedByPeer):
+    """
+    A peer on a require_auth() socket sent a wrong or missing token.
+    Receive loops already drop the connection on ConnectionClosedByPeer.
+    """
+
+
+_UNSET = object()
+
+
+def _inflate(payload: memoryview, flags: int, limit: int = MAX_FRAME_SIZE) -> memoryview:
+    """Undo the compression announced in the frame flags."""
+    compression = flags & _COMPRESSION_FLAGS
+    if not compression:
+        return payload
+    decompress = _DECOMPRESSORS.get(compression)
+    if decompress is None:
+        raise ValueError(f"Unsupported compression flags {flags:#x}")
+    with payload:
+        # Never inflate past the limit: a small frame can expand enormously.
+        data = decompress(payload, limit + 1)
+    if len(data) > limit:
+        raise FrameTooLarge(f"Frame inflates beyond {limit} bytes")
+    return memoryview(data)
+
+
+class FrameReader:
+    """
+    Buffered reader for length-prefixed frames on one socket.
+
+    Bytes are pulled with recv_into() into a single reusable bytearray, so a
+    burst of small messages costs one syscall and no per-fragment copies.
+    Every complete frame already buffered is handed out before the socket
+    is touched again.
+    """
+
+    def __init__(self, sock: socket.socket, bufsize: int = 65536):
+        # Weak reference: the module keeps one reader per socket and must
+        # not keep closed sockets alive.
+        self._sock = weakref.ref(sock)
+        self._bufsize = bufsize
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unread byte
+        self._end = 0    # one past the last received byte
+        # Set once the handshake switched the socket to length + flags headers.
+        self.flagged = False
+        # Flags and wire size (header included) of the frame last
+        # returned by _next_frame().
+        self.last_flags = 0
+        self.last_size = 0
+        self.max_frame_size = MAX_FRAME_SIZE
+
+    @property
+    def sock(self) -> socket.socket:
+        sock = self._sock()
+        if sock is None:
+            raise ConnectionClosedByPeer("Socket was garbage collected")
+        return sock
+
+    def buffered(self) -> int:
+        """Number of received bytes not handed out yet."""
+        return self._end - self._start
+
+    def set_timeout(self, timeout: float | None) -> None:
+        """Only touch the socket (fcntl) when the timeout actually changes."""
+        sock = self.sock
+        if sock.gettimeout() != timeout:
+            sock.settimeout(timeout)
+
+    def _reserve(self, size: int) -> None:
+        """Make sure `size` bytes fit after the unread data."""
+        if self._start + size <= len(self._buf):
+            return
+        pending = self._end - self._start
+        if size <= len(self._buf):
+            # Slide unread bytes to the front (memoryview copies overlap safely).
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # A frame bigger than the buffer: grow once to fit it.
+            grown = bytearray(size)
+            grown[:pending] = self._view[self._start:self._end]
+            self._view.release()
+            self._buf = grown
+            self._view = memoryview(self._buf)
+        self._start, self._end = 0, pending
+
+    def _shrink(self) -> None:
+        """Drop an oversized buffer once it has been drained."""
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buf) > self._bufsize:
+                self._view.release()
+                self._buf = bytearray(self._bufsize)
+                self._view = memoryview(self._buf)
+
+    def _fill(self) -> int:
+        """One recv_into() call into the free tail of the buffer."""
+        if self._end == len(self._buf):
+            self._reserve(self._end - self._start + 1)
+        n = self.sock.recv_into(self._view[self._end:])
+        if n == 0:
+            raise ConnectionClosedByPeer()
+        self._end += n
+        return n
+
+    def _frame_bounds(self) -> Tuple[int, int, int] | None:
+        """(start, end, flags) of the next complete frame payload, if buffered."""
+        pending = self._end - self._start
+        header = _FLAGGED_HEADER if self.flagged else _LENGTH_PREFIX
+        if pending < header.size:
+            return None
+        if self.flagged:
+            msg_len, flags = header.unpack_from(self._buf, self._start)
+        else:
+            msg_len, flags = header.unpack_from(self._buf, self._start)[0], 0
+        if msg_len > self.max_frame_size:
+            # Reject on the header, before buffering any of the body.
+            raise FrameTooLarge(f"Frame of {msg_len} bytes exceeds {self.max_frame_size}")
+        total = header.size + msg_len
+        if pending < total:
+            self._reserve(total)
+            return None
+        begin = self._start + header.size
+        return begin, begin + msg_len, flags
+
+    def _next_frame(self, timeout: float | None | object = _UNSET) -> memoryview | None:
+        """
+        Next frame payload as a view into the buffer, valid until the next
+        read. Returns None on timeout; partial data stays buffered.
+        """
+        bounds = self._frame_bounds()
+        if bounds is None:
+            if timeout is not _UNSET:
+                self.set_timeout(timeout)
+            try:
+                while bounds is None:
+                    self._fill()
+                    bounds = self._frame_bounds()
+            except socket.timeout:
+                return None
+        begin, end, flags = bounds
+        self.last_flags = flags
+        self.last_size = end - self._start
+        self._start = end
+        return _inflate(self._view[begin:end], flags, self.max_frame_size)
+
+    def recv_frame(self, timeout: float | None | object = _UNSET) -> bytes | None:
+        """Receive one frame payload. Returns None on timeout."""
+        frame = self._next_frame(timeout)
+        if frame is None:
+            return None
+        with frame:
+            data = bytes(frame)
+        self._shrink()
+        return data
+
+    def read_frames(self, timeout: float | None | object = _UNSET) -> list[bytes]:
+        """
+        Return every complete frame that has arrived, blocking only when
+        none is buffered. An empty list means timeout.
+        """
+        first = self.recv_frame(timeout)
+        if first is None:
+            return []
+        frames = [first]
+        while self._frame_bounds() is not None:
+            frames.append(self.recv_frame())
+        return frames
+
+    def recv(self, size: int) -> bytes:
+        """Raw stream read: buffered bytes first, then the socket."""
+        pending = self._end - self._start
+        if pending:
+            n = min(size, pending)
+            data = bytes(self._view[self._start:self._start + n])
+            self._start += n
+            self._shrink()
+            return data
+        data = self.sock.recv(size)
+        if not data:
+            raise ConnectionClosedByPeer()
+        return data
+
+    def recv_into(self, view: memoryview) -> int:
+        """Raw stream read into `view`: buffered bytes first, then the socket."""
+        pending = self._end - self._start
+        if pending:
+            n = min(len(view), pending)
+            view[:n] = self._view[self._start:self._start + n]
+            self._start += n
+            self._shrink()
+            return n
+        n = self.sock.recv_into(view)
+        if not n:
+            raise ConnectionClosedByPeer()
+        return n
+
+
+class _FairLock:
+    """
+    Re-entrant lock handed to waiters in arrival order. A bulk sender that
+    takes it per chunk goes to the back of the queue each time, so every
+    frame that was waiting meanwhile is written first.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._waiters: deque = deque()
+        self._owner: int | None = None
+        self._count = 0
+
+    def acquire(self) -> None:
+        me = threading.get_ident()
+        with self._mutex:
+            if self._owner == me:
+                self._count += 1
+                return
+            if self._owner is None and not self._waiters:
+                self._owner, self._count = me, 1
+                return
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append((me, waiter))
+        # release() makes us the owner before waking us up.
+        waiter.acquire()
+
+    def release(self) -> None:
+        with self._mutex:
+            self._count -= 1
+            if self._count:
+                return
+            if self._waiters:
+                self._owner, waiter = self._waiters.popleft()
+                self._count = 1
+                waiter.release()
+            else:
+                self._owner = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Session:
+    """
+    Per-socket protocol state: the frame reader and whatever the two peers
+    agreed on in the handshake. Fresh sockets speak plain JSON.
+    """
+    # Whether this implementation speaks resumable, multiplexed file
+    # transfers (data frames plus the resume exchange).
+    can_resume = True
+    can_multiplex = True
+
+    def __init__(self, sock: socket.socket):
+        self.reader = FrameReader(sock)
+        self.codec: Codec = DEFAULT_CODEC
+        # Server side: codec names this end prefers, best first.
+        # None accepts whatever the client lists first.
+        self.preferred_codecs: Tuple[str, ...] | None = None
+        self.compression: Compressor | None = None
+        self.compress_threshold = COMPRESS_THRESHOLD
+        self.resumable = False
+        # Attach the token to every message until the peer binds a session.
+        self.send_token = True
+        # Server side: reject peers until they present the token once.
+        self.auth_required = False
+        self.authenticated = False
+        # Server side: (thread, request id) of the last request received.
+        # Created on the first event while instrumentation is on.
+        self.stats: ConnStats | None = None
+
+        # Files travel as FLAG_DATA frames between ordinary messages.
+        self.multiplexed = False
+        self.next_stream_id = 1
+        # Receive side: stream id -> transfer in progress, and where
+        # recv_file() saves them.
+        self.incoming: Dict[int, _IncomingFile] = {}
+        self.save_dir: str | None = None
+
+        # Serialises writes; frames from different threads take turns.
+        self.write_lock = _FairLock()
+        # Held while a thread reads frames (re-entrant for recv_file).
+        self.read_lock = threading.RLock()
+        # Resume replies ("have N bytes") by transfer id, for send_file.
+        self.cond = threading.Condition()
+        self.resume_offsets: Dict[str, int] = {}
+        # Messages a sender read while waiting for its resume reply.
+        self.backlog: deque = deque()
+        # Receive buffer for file bodies, allocated on the first file.
+        self._file_buffer: bytearray | None = None
+
+    def file_buffer(self) -> memoryview:
+        if self._file_buffer is None:
+            self._file_buffer = bytearray(FILE_CHUNK_SIZE)
+        return memoryview(self._file_buffer)
+
+    @property
+    def flagged(self) -> bool:
+        return self.reader.flagged
+
+    def use_flagged_framing(self) -> None:
+        self.reader.flagged = True
+
+
+_sessions: "weakref.WeakKeyDictionary[socket.socket, Session]" = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+
+def get_session(sock: socket.socket) -> Session:
+    """Return the Session bound to this socket, creating it on first use."""
+    session = _sessions.get(sock)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(sock)
+            if session is None:
+                session = Session(sock)
+                _sessions[sock] = session
+    return session
+
+
+def frame_reader(sock: socket.socket) -> FrameReader:
+    """
+    Return the FrameReader bound to this socket.
+    All receive helpers go through it, so bytes read ahead are never lost.
+    """
+    return get_session(sock).reader
+
+
+# ==========================================
+# Instrumentation
+# ==========================================
+
+# Off by default: every instrumented call site costs one global lookup.
+_stats_enabled = False
+_stats_hooks: list = []
+# Op name the bytes of file bodies are counted under.
+FILE_STATS_OP = "<file>"
+
+
+class Histogram:
+    """
+    Durations in power-of-two nanosecond buckets: recording is a
+    bit_length() and an increment, quantiles come back within a factor of 2.
+    """
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * 65
+        self.count = 0
+        self.total = 0
+
+    def record(self, ns: int) -> None:
+        self.counts[ns.bit_length()] += 1
+        self.count += 1
+        self.total += ns
+
+    def quantile(self, q: float) -> int:
+        """Upper bound (ns) of the bucket holding the q-quantile."""
+        target = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= target:
+                return 1 << bucket
+        return 0
+
+    def snapshot(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_us": round(self.total / self.count / 1e3, 1),
+            "p50_us": round(self.quantile(0.5) / 1e3, 1),
+            "p99_us": round(self.quantile(0.99) / 1e3, 1),
+        }
+
+
+class OpStats:
+    __slots__ = ("frames_in", "frames_out", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.frames_in = self.frames_out = 0
+        self.bytes_in = self.bytes_out = 0
+
+
+class ConnStats:
+    """Counters of one socket, kept while instrumentation is on."""
+
+    def __init__(self):
+        self.frames_in = self.frames_out = 0
+        self.bytes_in = self.bytes_out = 0
+        self.encode = Histogram()
+        self.decode = Histogram()
+        # Time spent in send (write lock wait included) and blocked in recv.
+        self.send_blocked = Histogram()
+        self.recv_wait = Histogram()
+        self.ops: Dict[Any, OpStats] = {}
+
+    def op(self, name: Any) -> OpStats:
+        stats = self.ops.get(name)
+        if stats is None:
+            stats = self.ops[name] = OpStats()
+        return stats
+
+    def snapshot(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "encode": self.encode.snapshot(),
+            "decode": self.decode.snapshot(),
+            "send_blocked": self.send_blocked.snapshot(),
+            "recv_wait": self.recv_wait.snapshot(),
+            "ops": {"-" if name is None else str(name): {"frames_in": op.frames_in, "frames_out": op.frames_out,
+                                "bytes_in": op.bytes_in, "bytes_out": op.bytes_out}
+                    for name, op in list(self.ops.items())},
+        }
+
+
+def _record(session: Session, event: str, op: Any, nbytes: int, elapsed_ns: int | None, frames: int = 1) -> None:
+    """
+    Account one event: "encode"/"decode" (one message of `op`), "send"
+    (`frames` frames written) or "recv" (one frame read).
+    """
+    stats = session.stats
+    if stats is None:
+        stats = session.stats = ConnStats()
+    if event == "encode":
+        if elapsed_ns is not None:
+            stats.encode.record(elapsed_ns)
+        per_op = stats.op(op)
+        per_op.frames_out += 1
+        per_op.bytes_out += nbytes
+    elif event == "decode":
+        if elapsed_ns is not None:
+            stats.decode.record(elapsed_ns)
+        per_op = stats.op(op)
+        per_op.frames_in += 1
+        per_op.bytes_in += nbytes
+    elif event == "send":
+        stats.send_blocked.record(elapsed_ns)
+        stats.frames_out += frames
+        stats.bytes_out += nbytes
+        if op is not None:
+            stats.op(op).bytes_out += nbytes
+    else:
+        stats.recv_wait.record(elapsed_ns)
+        stats.frames_in += 1
+        stats.bytes_in += nbytes
+    for hook in _stats_hooks:
+        hook(event, stats, op, nbytes, elapsed_ns)
+
+
+def enable_stats(enabled: bool = True) -> None:
+    """Turn per-socket instrumentation on or off for the whole process."""
+    global _stats_enabled
+    _stats_enabled = enabled
+
+
+def stats_enabled() -> bool:
+    return _stats_enabled
+
+
+def reset_stats() -> None:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        session.stats = None
+
+
+def add_stats_hook(hook) -> None:
+    """
+    Call hook(event, conn_stats, op, nbytes, elapsed_ns) on every recorded
+    event; elapsed_ns is None for file bytes. Hooks run on the I/O thread,
+    so they must be quick.
+    """
+    _stats_hooks.append(hook)
+
+
+def remove_stats_hook(hook) -> None:
+    if hook in _stats_hooks:
+        _stats_hooks.remove(hook)
+
+
+def _peer_label(sock: socket.socket) -> str:
+    try:
+        peer = sock.getpeername()
+    except OSError:
+        return f"fd {sock.fileno()}"
+    if isinstance(peer, tuple):
+        return f"{peer[0]}:{peer[1]}"
+    return peer or f"fd {sock.fileno()}"
+
+
+def stats_snapshot(sock: socket.socket | None = None) -> dict:
+    """
+    Counters of one socket, or {peer label: counters} for every socket
+    that has moved data since instrumentation was turned on.
+    """
+    if sock is not None:
+        stats = get_session(sock).stats
+        return stats.snapshot() if stats is not None else {}
+    with _sessions_lock:
+        items = list(_sessions.items())
+    return {_peer_label(s): session.stats.snapshot() for s, session in items if session.stats is not None}
+
+
+def format_stats(snapshot: dict) -> str:
+    """Human readable rendering of stats_snapshot(), for admin consoles."""
+    if not snapshot:
+        return "no instrumented connections" + ("" if _stats_enabled else " (stats are off)")
+    lines = []
+    for label, conn in snapshot.items():
+        lines.append(f"{label}: in {conn['frames_in']} frames / {conn['bytes_in']} B, "
+                     f"out {conn['frames_out']} frames / {conn['bytes_out']} B")
+        for name in ("encode", "decode", "send_blocked", "recv_wait"):
+            hist = conn[name]
+            if hist["count"]:
+                lines.append(f"    {name:<12} n={hist['count']} mean={hist['mean_us']}us "
+                             f"p50<={hist['p50_us']}us p99<={hist['p99_us']}us")
+        for op, counts in sorted(conn["ops"].items()):
+            lines.append(f"    op {op:<24} in {counts['frames_in']}/{counts['bytes_in']} B  "
+                         f"out {counts['frames_out']}/{counts['bytes_out']} B")
+    return "\n".join(lines)
+
+
+_watch_hook = None
+
+
+def stats_command(args: str = "") -> str:
+    """
+    Shared admin console command; servers pass whatever followed "stats":
+      (nothing)       print every connection's counters
+      on | off        enable / disable instrumentation
+      reset           drop all counters
+      watch <ms>      log every send/recv/decode slower than <ms>
+      unwatch         stop watching
+    """
+    global _watch_hook
+    parts = args.split()
+    if not parts:
+        return format_stats(stats_snapshot())
+    cmd = parts[0].lower()
+    if cmd in ("on", "off"):
+        enable_stats(cmd == "on")
+        return f"stats {cmd}"
+    if cmd == "reset":
+        reset_stats()
+        return "stats reset"
+    if cmd == "watch" and len(parts) == 2:
+        threshold_ns = int(float(parts[1]) * 1e6)
+
+        def watch(event, stats, op, nbytes, elapsed_ns):
+            if elapsed_ns is not None and elapsed_ns >= threshold_ns:
+                print(f"[stats] slow {event} op={op} {nbytes} B {elapsed_ns / 1e6:.1f} ms")
+
+        remove_stats_hook(_watch_hook)
+        _watch_hook = watch
+        add_stats_hook(watch)
+        enable_stats(True)
+        return f"watching operations slower than {parts[1]} ms"
+    if cmd == "unwatch":
+        remove_stats_hook(_watch_hook)
+        _watch_hook = None
+        return "stopped watching"
+    return "usage: stats [on|off|reset|watch <ms>|unwatch]"
+
+
+# ==========================================
+# Handshake
+# ==========================================
+
+HELLO_OP = "__hello__"
+# Request id, set by RpcConnection; the server echoes it as REPLY_FIELD by
+# passing it to send_json(..., reply_to=...).
+RID_FIELD = "rid"
+REPLY_FIELD = "re"
+
+
+def set_preferred_codecs(sock: socket.socket, codecs: Iterable[str]) -> None:
+    """Server side: codecs to pick from when a client says hello, best first."""
+    get_session(sock).preferred_codecs = tuple(codecs)
+
+
+def set_max_frame_size(sock: socket.socket, size: int) -> None:
+    """
+    Largest frame accepted on this socket; a bigger length prefix raises
+    FrameTooLarge before any of the body is buffered.
+    """
+    get_session(sock).reader.max_frame_size = size
+
+
+def set_compress_threshold(sock: socket.socket, threshold: int) -> None:
+    """Only compress frames whose payload is larger than `threshold` bytes."""
+    get_session(sock).compress_threshold = threshold
+
+
+def require_auth(sock: socket.socket) -> None:
+    """
+    Server side: the peer must present the token once, in its hello or (for
+    clients without the handshake) its first message, before anything else
+    is accepted. recv_json raises AuthenticationFailed otherwise.
+    """
+    get_session(sock).auth_required = True
+
+
+def _token_ok(presented: Any) -> bool:
+    if token is None:
+        # No TOKEN configured: nothing to check against.
+        return True
+    return isinstance(presented, str) and hmac.compare_digest(presented, token)
+
+
+def _authenticate(session: Session, msg: Any) -> None:
+    """Bind the session on the first message of a require_auth() peer."""
+    if not (isinstance(msg, dict) and _token_ok(msg.get("token"))):
+        raise AuthenticationFailed("invalid token")
+    session.authenticated = True
+
+
+def _hello_request(codecs: Iterable[str], compression: Iterable[str],
+                   resume: bool = True, streams: bool = True) -> dict:
+    return {
+        "op": HELLO_OP,
+        "token": token,
+        "codecs": [name for name in codecs if name in CODECS],
+        "compression": [name for name in compression if name in COMPRESSORS],
+        "resume": resume,
+        "streams": streams,
+    }
+
+
+def _is_hello_request(msg: Any) -> bool:
+    return isinstance(msg, dict) and msg.get("op") == HELLO_OP and "codecs" in msg
+
+
+def _hello_reply(session: Session, hello: dict) -> dict:
+    """Server side: pick a codec and compression from the client's offer."""
+    offered = [name for name in hello.get("codecs", []) if name in CODECS]
+    if session.preferred_codecs is not None:
+        candidates = [name for name in session.preferred_codecs if name in offered]
+    else:
+        candidates = offered
+    # Clients that predate compression do not send the key: keep "!I" frames.
+    algorithms = hello.get("compression")
+    compressor = None
+    if algorithms is not None:
+        compressor = next((name for name in algorithms if name in COMPRESSORS), None)
+    # Files resume only as multiplexed streams, and data frames need the
+    # flags byte: the two are granted together or not at all.
+    streams = (bool(hello.get("resume")) and session.can_resume and algorithms is not None
+               and bool(hello.get("streams")) and session.can_multiplex)
+    return {
+        "op": HELLO_OP,
+        "codec": candidates[0] if candidates else DEFAULT_CODEC.name,
+        "flags": algorithms is not None,
+        "compression": compressor,
+        "resume": streams,
+        "streams": streams,
+        # Authenticated once: neither side attaches the token any more.
+        "session": True,
+    }
+
+
+def _apply_hello(session: Session, reply: dict) -> None:
+    """Both sides: switch to what the hello reply announced."""
+    chosen = reply.get("codec")
+    if chosen in CODECS:
+        session.codec = CODECS[chosen]
+    if reply.get("flags"):
+        session.compression = COMPRESSORS.get(reply.get("compression"))
+        session.use_flagged_framing()
+    session.resumable = bool(reply.get("resume"))
+    session.multiplexed = bool(reply.get("streams"))
+    if reply.get("session"):
+        session.send_token = False
+
+
+def handshake(sock: socket.socket, codecs: Iterable[str] = ("binary", "json"),
+              compression: Iterable[str] = ("zstd", "zlib"), timeout: float | None = 5.0) -> str:
+    """
+    Client side: offer codecs and compression algorithms (best first) and
+    switch to what the server picks. Servers that do not know the handshake
+    leave the socket on plain JSON frames.
+    Returns the codec name in use.
+    """
+    session = get_session(sock)
+    send_json(sock, _hello_request(codecs, compression))
+    reply = recv_json(sock, timeout)
+    if reply is not None and reply.get("op") == HELLO_OP:
+        _apply_hello(session, reply)
+    return session.codec.name
+
+
+def _answer_hello(sock: socket.socket, session: Session, hello: dict) -> None:
+    """Server side: reply with the old framing and codec, then switch."""
+    reply = _hello_reply(session, hello)
+    send_json(sock, reply)
+    _apply_hello(session, reply)
+
+
+def _decode_message(session: Session, frame: memoryview) -> Any:
+    try:
+        with frame:
+            return session.codec.decode(frame)
+    except Exception:
+        return None
+
+
+def _recv_item(sock: socket.socket, session: Session, timeout: float | None,
+              until_resume: bool = False) -> Tuple[Any, str | None]:
+    """
+    Next (message, file path) for the application; path is set when a
+    multiplexed transfer completes. Handshake requests, resume replies and
+    data frames are handled here and never reach the caller. With
+    until_resume, a resume reply ends the call (returning None) so a
+    waiting sender can proceed.
+    """
+    reader = session.reader
+    while True:
+        with session.read_lock:
+            instrumented = _stats_enabled
+            if instrumented:
+                started = time.perf_counter_ns()
+            try:
+                frame = reader._next_frame(timeout)
+            except (ConnectionClosedByPeer, OSError):
+                _close_incoming(session)
+                raise
+            if frame is None:
+                return None, None
+            if instrumented:
+                decoding = time.perf_counter_ns()
+                _record(session, "recv", None, reader.last_size, decoding - started)
+            if reader.last_flags & FLAG_DATA:
+                if instrumented:
+                    _record(session, "decode", FILE_STATS_OP, reader.last_size, None)
+                with frame:
+                    done = _recv_data(session, frame)
+                reader._shrink()
+                if done is not None:
+                    return done
+                continue
+            result = _decode_message(session, frame)
+            reader._shrink()
+            if instrumented:
+                _record(session, "decode", result.get("op") if isinstance(result, dict) else None,
+                        reader.last_size, time.perf_counter_ns() - decoding)
+        if session.auth_required and not session.authenticated:
+            _authenticate(session, result)
+        if _is_hello_request(result):
+            _answer_hello(sock, session, result)
+            continue
+        if isinstance(result, dict):
+            if result.get("op") == RESUME_OP:
+                with session.cond:
+                    session.resume_offsets[result.get("transfer_id")] = int(result.get("have", 0))
+                    session.cond.notify_all()
+                if until_resume:
+                    return None, None
+                continue
+            if result.get("stream") is not None and session.multiplexed and session.save_dir is not None:
+                done = _start_incoming(sock, session, result)
+                if done is not None:
+                    return done
+                continue
+        return result, None
+
+
 def recv_json(sock: socket.socket, timeout: float | None  = None) -> dict | None:
     """
     Receive a JSON dictionary using length-prefixed framing.
     Returns None if timeout or invalid JSON.
     Raises ConnectionClosedByPeer if the socket is closed by peer.
     """
-    sock.settimeout(timeout)
-    
-    # Read 4-byte length prefix
-    prefix = b""
-    try:
-        while len(prefix) < 4:
-            chunk = sock.recv(4 - len(prefix))
-            if not chunk:
-                raise ConnectionClosedByPeer()
-            prefix += chunk
-    except socket.timeout:
-        return None
+    session = get_session(sock)
+    if session.backlog:
+        return session.backlog.popleft()[0]
+    return _recv_item(sock, session, timeout)[0]
 
-    msg_len = struct.unpack("!I", prefix)[0]
 
-    # Read the message
-    data = b""
-    try:
-        while len(data) < msg_len:
-            chunk = sock.recv(msg_len - len(data))
-            if not chunk:
-                raise ConnectionClosedByPeer()
-            data += chunk
-    except socket.timeout:
-        return None
+# ==========================================
+# File transfer
+# ==========================================
+
+RESUME_OP = "__resume__"
+# How long send_file waits for the receiver's resume reply.
+RESUME_TIMEOUT = 30.0
+# Size of a single recv_into() while receiving a file body.
+FILE_CHUNK_SIZE = 256 * 1024
+# File bytes per data frame when multiplexed: the most a control message
+# waits behind a transfer.
+STREAM_CHUNK_SIZE = 32 * 1024
+
+
+def transfer_id_for(file_path: str) -> str:
+    """
+    Default transfer id: stable for as long as the file is not rewritten,
+    so a retry after a dropped connection finds the receiver's partial file.
+    """
+    st = os.stat(file_path)
+    key = f"{os.path.basename(file_path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
 
+def _await_resume(sock: socket.socket, session: Session, transfer_id: str, timeout: float | None) -> int:
+    """
+    Wait for the receiver's "have N bytes" reply. If another thread owns the
+    socket's reads (e.g. a listener thread) it hands the reply over;
+    otherwise read it here and park anything else in the backlog.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    previous_timeout = sock.gettimeout()
     try:
-        result = json.loads(data.decode("utf-8"))
-    except Exception:
-        return None
+        while True:
+            with session.cond:
+                if transfer_id in session.resume_offsets:
+                    return session.resume_offsets.pop(transfer_id)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise socket.timeout(f"No resume reply for transfer {transfer_id}")
+            if session.read_lock.acquire(blocking=False):
+                try:
+                    item = _recv_item(sock, session, remaining, until_resume=True)
+                finally:
+                    session.read_lock.release()
+                if item != (None, None):
+                    session.backlog.append(item)
+            else:
+                with session.cond:
+                    session.cond.wait_for(lambda: transfer_id in session.resume_offsets, remaining)
+    finally:
+        frame_reader(sock).set_timeout(previous_timeout)
+
+
+def file_sha256(file_path: str) -> str:
+    """Hex SHA-256 of a file, as carried in file transfer headers."""
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
 
-    return result
 
-def send_file(sock: socket.socket, file_path: str, data: dict) -> None:
+def _add_file_header(file_path: str, data: dict) -> int:
     """
-    Send a file + metadata.
-    Protocol: [Length-Prefixed JSON Header (with filesize)] + [Raw File Bytes]
+    Add filename/filesize/sha256 to the metadata; returns the size.
+    Callers that already know the digest pass it in data["sha256"].
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
@@ -95,27 +1268,207 @@ def send_file(sock: socket.socket, file_path: str, data: dict) -> None:
     # Add file details to the metadata
     data["filename"] = os.path.basename(file_path)
     data["filesize"] = filesize
-    
-    # 1. Send the JSON Header
-    # This will attach the token and handle the length prefix automatically
-    send_json(sock, data)
+    if not data.get("sha256"):
+        data["sha256"] = file_sha256(file_path)
+    return filesize
 
-    # 2. Send the Raw File Body
+
+def _recv_body(reader: FrameReader, f, hasher, length: int, buf: memoryview) -> None:
+    """Copy `length` raw bytes from the socket to `f`, hashing on the way."""
+    while length > 0:
+        n = reader.recv_into(buf[:min(length, len(buf))])
+        chunk = buf[:n]
+        hasher.update(chunk)
+        f.write(chunk)
+        length -= n
+
+
+def _check_digest(metadata: dict, hasher) -> None:
+    """Verify the sender's digest (if any) and report ours in the metadata."""
+    digest = hasher.hexdigest()
+    expected = metadata.get("sha256")
+    if expected is not None and expected != digest:
+        raise ValueError(f"Checksum mismatch for {metadata.get('filename')}: {digest} != {expected}")
+    metadata["sha256"] = digest
+
+
+def send_file(sock: socket.socket, file_path: str, data: dict, transfer_id: str | None = None,
+              reply_to: Any = None) -> None:
+    """
+    Send a file + metadata.
+    Protocol: [Length-Prefixed JSON Header (with filesize)] + [Raw File Bytes]
+
+    On a multiplexed connection the header carries a transfer id, the
+    receiver answers with how many bytes it already has, and the rest goes
+    out as data frames, interleaved with other threads' messages on this
+    socket.
+    With `reply_to`, the header is the reply to that request.
+    """
+    filesize = _add_file_header(file_path, data)
+    if reply_to is not None:
+        data[REPLY_FIELD] = reply_to
+    session = get_session(sock)
+    if session.multiplexed:
+        data["transfer_id"] = transfer_id or transfer_id_for(file_path)
+        _send_streamed(sock, session, file_path, filesize, data)
+        return
+
+    # Nothing else may be written until the raw body is complete
+    with session.write_lock:
+        # 1. Send the JSON Header
+        # This will attach the token and handle the length prefix automatically
+        send_json(sock, data)
+
+        # 2. Send the Raw File Body
+        with open(file_path, "rb") as f:
+            # sendfile is more efficient than reading/writing in a loop in userspace
+            _sendfile(sock, session, f)
+
+
+def _sendfile(sock: socket.socket, session: Session, f, offset: int = 0, count: int | None = None) -> None:
+    if not _stats_enabled:
+        sock.sendfile(f, offset, count)
+        return
+    started = time.perf_counter_ns()
+    sent = sock.sendfile(f, offset, count)
+    _record(session, "send", FILE_STATS_OP, sent, time.perf_counter_ns() - started, 0)
+
+
+def _send_streamed(sock: socket.socket, session: Session, file_path: str, filesize: int, data: dict) -> None:
+    with session.cond:
+        stream_id = session.next_stream_id
+        session.next_stream_id += 1
+    data["stream"] = stream_id
+    send_json(sock, data)
+    offset = _await_resume(sock, session, data["transfer_id"], RESUME_TIMEOUT)
+    if not 0 <= offset <= filesize:
+        offset = 0
+    prefix = _STREAM_ID.pack(stream_id)
     with open(file_path, "rb") as f:
-        # sendfile is more efficient than reading/writing in a loop in userspace
-        sock.sendfile(f)
+        while offset < filesize:
+            length = min(STREAM_CHUNK_SIZE, filesize - offset)
+            header = _FLAGGED_HEADER.pack(_STREAM_ID.size + length, FLAG_DATA)
+            # One data frame per turn of the write lock
+            with session.write_lock:
+                _write_buffers(sock, [header, prefix])
+                _sendfile(sock, session, f, offset, length)
+            offset += length
+
+
+def _partial_path(save_dir: str, transfer_id: str) -> str:
+    safe_id = "".join(c for c in str(transfer_id) if c.isalnum() or c in "-_")
+    return os.path.join(save_dir, f".{safe_id}.part")
+
+
+class _IncomingFile:
+    """Receive side of one multiplexed transfer."""
+
+    def __init__(self, metadata: dict, part_path: str, file_path: str):
+        self.metadata = metadata
+        self.part_path = part_path
+        self.file_path = file_path
+        self.filesize = metadata["filesize"]
+        self.have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if self.have > self.filesize:
+            self.have = 0
+        self.f = open(part_path, "r+b" if self.have else "w+b")
+        self.f.truncate(self.have)
+        # Only the part kept from an earlier attempt is read back.
+        self.hasher = hashlib.file_digest(self.f, "sha256")
+
+    def finish(self) -> Tuple[dict, str]:
+        self.f.close()
+        try:
+            _check_digest(self.metadata, self.hasher)
+        except ValueError:
+            os.remove(self.part_path)
+            raise
+        os.replace(self.part_path, self.file_path)
+        return self.metadata, self.file_path
+
+
+def _close_incoming(session: Session) -> None:
+    """Close the files of unfinished transfers; their .part files stay for a retry."""
+    for incoming in session.incoming.values():
+        incoming.f.close()
+    session.incoming.clear()
+
+
+def close_transfers(sock: socket.socket) -> None:
+    """
+    Receive side, when a connection is given up on: close the files of
+    multiplexed transfers still in flight. Partial data is kept, so the
+    sender's retry resumes it.
+    """
+    session = get_session(sock)
+    with session.read_lock:
+        _close_incoming(session)
+
+
+def _start_incoming(sock: socket.socket, session: Session, metadata: dict) -> Tuple[dict, str] | None:
+    """Header of a multiplexed transfer: answer with the resume offset."""
+    filesize = metadata.get("filesize")
+    filename = metadata.get("filename")
+    transfer_id = metadata.get("transfer_id")
+    if filesize is None or filename is None or transfer_id is None:
+        raise ValueError(f"Malformed stream header: {metadata}")
+    os.makedirs(session.save_dir, exist_ok=True)
+    for stream_id, stale in list(session.incoming.items()):
+        if stale.metadata.get("transfer_id") == transfer_id:
+            # A retry of a transfer the sender broke off: resume from its part
+            stale.f.close()
+            del session.incoming[stream_id]
+    incoming = _IncomingFile(metadata, _partial_path(session.save_dir, transfer_id),
+                             os.path.join(session.save_dir, filename))
+    send_json(sock, {"op": RESUME_OP, "transfer_id": transfer_id, "have": incoming.have})
+    if incoming.have == incoming.filesize:
+        return incoming.finish()
+    session.incoming[metadata["stream"]] = incoming
+    return None
+
+
+def _recv_data(session: Session, frame: memoryview) -> Tuple[dict, str] | None:
+    """Append a data frame to its transfer; returns it once complete."""
+    (stream_id,) = _STREAM_ID.unpack_from(frame)
+    incoming = session.incoming.get(stream_id)
+    if incoming is None:
+        # Transfer already failed on this side
+        return None
+    data = frame[_STREAM_ID.size:]
+    incoming.hasher.update(data)
+    incoming.f.write(data)
+    incoming.have += len(data)
+    if incoming.have < incoming.filesize:
+        return None
+    del session.incoming[stream_id]
+    return incoming.finish()
 
 
 def recv_file(sock: socket.socket, save_dir: str, timeout: float | None = None) -> Tuple[dict | None, str | None]:
     """
     Receive a JSON header followed by a binary file.
     Returns: (metadata_dict, saved_file_path)
+
+    On a multiplexed connection, messages keep arriving while files are in
+    flight: each call returns the next message (path None) or the next
+    completed file, whichever comes first.
     """
+    session = get_session(sock)
+    with session.read_lock:
+        session.save_dir = save_dir
+        return _recv_file(sock, session, save_dir, timeout)
+
+
+def _recv_file(sock: socket.socket, session: Session, save_dir: str,
+               timeout: float | None) -> Tuple[dict | None, str | None]:
     # 1. Receive the JSON Header
-    metadata = recv_json(sock, timeout)
+    if session.backlog:
+        metadata, path = session.backlog.popleft()
+    else:
+        metadata, path = _recv_item(sock, session, timeout)
     
-    if metadata is None:
-        return None, None
+    if metadata is None or path is not None:
+        return metadata, path
     
     # Check if this message actually contains a file
     filesize = metadata.get("filesize")
@@ -129,22 +1482,19 @@ def recv_file(sock: socket.socket, save_dir: str, timeout: float | None = None)
     # Ensure the save directory exists
     os.makedirs(save_dir, exist_ok=True)
     file_path = os.path.join(save_dir, filename)
-    
-    sock.settimeout(timeout)
-    remaining = filesize
+
+    reader = session.reader
+    reader.set_timeout(timeout)
+    hasher = hashlib.sha256()
     
     try:
         with open(file_path, "wb") as f:
-            while remaining > 0:
-                # Read in chunks (e.g., 4KB) to avoid memory overload on large files
-                chunk_size = 4096 if remaining > 4096 else remaining
-                chunk = sock.recv(chunk_size)
-                
-                if not chunk:
-                    raise ConnectionClosedByPeer("Socket closed during file transfer")
-                
-                f.write(chunk)
-                remaining -= len(chunk)
+            # Bytes that arrived together with the header are served first,
+            # then the body goes straight from the socket into a reused buffer
+            _recv_body(reader, f, hasher, filesize, session.file_buffer())
+        if _stats_enabled:
+            _record(session, "decode", FILE_STATS_OP, filesize, None)
+        _check_digest(metadata, hasher)
     except socket.timeout:
         return None, None
     except Exception as e:
@@ -153,4 +1503,115 @@ def recv_file(sock: socket.socket, save_dir: str, timeout: float | None = None)
             os.remove(file_path)
         raise e
 
-    return metadata, file_path
\ No newline at end of file
+    return metadata, file_path
+
+
+# ==========================================
+# Request / response
+# ==========================================
+
+class RpcConnection:
+    """
+    Requests and replies on one socket, with any number of requests in
+    flight. Each request carries an id that the peer echoes in its reply
+    (send_json(..., reply_to=msg[RID_FIELD])), so replies are matched by id
+    instead of by position and a late reply to a request that already timed
+    out is dropped rather than handed to the next one.
+
+    If a listener thread owns the socket's reads it passes what it receives
+    to dispatch(). Otherwise waiting callers take turns reading, and
+    messages without an id go to `on_message` (or back to recv_json).
+    """
+
+    def __init__(self, sock: socket.socket, save_dir: str | None = None, on_message=None):
+        self.sock = sock
+        self.session = get_session(sock)
+        # Where files sent as replies are saved; None receives messages only.
+        self.save_dir = save_dir
+        self.on_message = on_message
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._cond = threading.Condition()
+        # Replies that arrived after their request was given up on.
+        self.dropped = 0
+
+    def request(self, obj: dict) -> Future:
+        """Send a request; the future resolves to (reply, file path or None)."""
+        rid = next(self._ids)
+        future = Future()
+        future.request_id = rid
+        with self._cond:
+            self._pending[rid] = future
+        try:
+            send_json(self.sock, {**obj, RID_FIELD: rid})
+        except BaseException:
+            self.cancel(future)
+            raise
+        return future
+
+    def call(self, obj: dict, timeout: float | None = None) -> Tuple[Any, str | None]:
+        """request() + wait(). Raises TimeoutError if no reply arrives in time."""
+        return self.wait(self.request(obj), timeout)
+
+    def cancel(self, future: Future) -> None:
+        """Give up on a request; its reply will be dropped if it ever comes."""
+        with self._cond:
+            self._pending.pop(future.request_id, None)
+        future.cancel()
+
+    def dispatch(self, msg: Any, path: str | None = None) -> bool:
+        """
+        Hand a received message to the request it answers.
+        Returns False for messages that answer no request (notifications).
+        """
+        if not isinstance(msg, dict) or REPLY_FIELD not in msg:
+            return False
+        with self._cond:
+            future = self._pending.pop(msg[REPLY_FIELD], None)
+            if future is None:
+                self.dropped += 1
+            else:
+                future.set_result((msg, path))
+            self._cond.notify_all()
+        return True
+
+    def wait(self, future: Future, timeout: float | None = None) -> Tuple[Any, str | None]:
+        """Block until the reply arrives, reading the socket if nobody else is."""
+        if not self._drive(future.done, timeout):
+            self.cancel(future)
+            raise TimeoutError(f"No reply to request {future.request_id}")
+        return future.result()
+
+    def _drive(self, ready, timeout: float | None) -> bool:
+        """
+        Wait until ready() holds, taking a turn at reading the socket when
+        nobody else is. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        read_lock = self.session.read_lock
+        while True:
+            with self._cond:
+                while not ready():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    if read_lock.acquire(blocking=False):
+                        break
+                    # Woken by dispatch() or by a reader stepping down.
+                    self._cond.wait(remaining)
+                else:
+                    return True
+            try:
+                if self.save_dir is not None:
+                    msg, path = recv_file(self.sock, self.save_dir, remaining)
+                else:
+                    msg, path = recv_json(self.sock, remaining), None
+                if msg is not None and not self.dispatch(msg, path):
+                    if self.on_message is not None:
+                        self.on_message(msg, path)
+                    else:
+                        self.session.backlog.append((msg, path))
+            finally:
+                with self._cond:
+                    read_lock.release()
+                    self._cond.notify_all()